@@ -1,14 +1,29 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from cachetools import TTLCache
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app import crud, schemas
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import crud, invalidation, metrics, models, schemas
 from app.config import settings
-from app.database import get_db
+from app.database import get_async_db
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# min/max iguales al costo configurado: cualquier hash con otro costo se
+# re-calcula en el siguiente login (ver verify_password_async).
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 ALGORITHM = "HS256"
@@ -19,6 +34,40 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+
+# bcrypt corre en un pool propio para no ocupar el threadpool de las rutas
+# síncronas; más de PASSWORD_HASH_MAX_PENDING trabajos en espera responde 429.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
+
+
+async def _run_hashing(fn, *args):
+    global _hash_pending
+    if _hash_pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiadas solicitudes de autenticación, intenta de nuevo",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_pending -= 1
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_hashing(pwd_context.hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Devuelve (válida, nuevo_hash); nuevo_hash no es None si el costo configurado cambió."""
+    return await _run_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+def shutdown_hashing() -> None:
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -26,16 +75,74 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def create_user_token(user) -> str:
+    data = {"sub": user.username}
+    if settings.ACCESS_TOKEN_INCLUDE_USER_ID:
+        data["uid"] = user.id
+    return create_access_token(data)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Usuario autenticado tal como lo ven las rutas protegidas."""
+    id: int
+    username: str
+
+
+# Principales por `sub`; se invalidan cuando el usuario cambia (ver listeners abajo).
+_principals: TTLCache = TTLCache(maxsize=settings.AUTH_USER_CACHE_MAXSIZE, ttl=settings.AUTH_USER_CACHE_TTL_SECONDS)
+_principals_lock = threading.Lock()
+
+
+def invalidate_user(username: str) -> None:
+    with _principals_lock:
+        _principals.pop(username, None)
+
+
+def clear_user_cache() -> None:
+    with _principals_lock:
+        _principals.clear()
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    history = inspect(target).attrs.username.history
+    for username in (target.username, *(history.deleted or ())):
+        invalidate_user(username)
+        # Los demás workers lo invalidan cuando la transacción hace commit.
+        invalidation.notify(connection, "user", username=username)
+
+
+invalidation.register("user", invalidate_user)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        with metrics.stage("jwt"):
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = crud.get_user_by_username(db, username=username)
-    if user is None:
+    user_id = payload.get("uid")
+
+    with _principals_lock:
+        principal = _principals.get(username)
+    if principal is not None and (user_id is None or principal.id == user_id):
+        metrics.record_cache("principals", "hit")
+        return principal
+    metrics.record_cache("principals", "miss")
+
+    user = await crud.get_user_by_username_async(db, username=username)
+    if user is None or (user_id is not None and user.id != user_id):
         raise credentials_exception
-    return user
+    principal = Principal(id=user.id, username=user.username)
+    # Devuelve la conexión al pool: la sesión vive hasta el final de la
+    # respuesta, que en streaming (SSE) puede durar minutos.
+    await db.rollback()
+    with _principals_lock:
+        _principals[username] = principal
+    return principal
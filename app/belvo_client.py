@@ -1,63 +1,64 @@
-import requests
-from requests.auth import HTTPBasicAuth
-from app.config import settings
-from typing import Any, Dict, Optional
+import asyncio
+import hashlib
+import time
+import httpx
+from cachetools import TTLCache
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app import models
-import json
+from app import crud, institution_cache, invalidation, metrics, models
+from app.config import settings
 from fastapi import HTTPException
-import re
-import rstr
-
-from app.database import engine, get_db
+from rstr.xeger import Xeger
 
-auth = HTTPBasicAuth(settings.BELVO_CLIENT_ID, settings.BELVO_SECRET)
-BASE = settings.BELVO_BASE_URL.rstrip("/")
+from app.belvo_http import request
+from app.kpi_cache import kpi_cache
+from app.database import SessionLocal
 
-def list_institutions(page: int = 1, per_page: int = 50, db: Optional[Session] = None) -> Dict[str, Any]:
-    if db is None:
-        db = next(get_db()) 
-    url = f"{BASE}/institutions/"
+async def list_institutions(page: int = 1, per_page: int = 50, db: Optional[Session] = None) -> Dict[str, Any]:
     params = {"page": page, "page_size": per_page}
-    r = requests.get(url, auth=auth, params=params, timeout=15)
+    r = await request("GET", "/institutions/", params=params)
     r.raise_for_status()
 
     institutions = r.json()
     results = institutions.get("results", institutions)
-
-    try:
-        for inst in results:
-            existing = db.query(models.Institution).filter(models.Institution.id == str(inst["id"])).first()
-            if existing:
-                for key, value in inst.items():
-                    if hasattr(existing, key):
-                        setattr(existing, key, value)
-            else:
-                db.add(models.Institution(**{k: v for k, v in inst.items() if hasattr(models.Institution, k)}))
-
-        db.commit()
-    finally:
-        db.close()
+    # La sesión es síncrona: el upsert corre en un hilo para no bloquear el event loop.
+    await asyncio.to_thread(_store_institutions, results, db)
     return institutions
 
-def get_institution(institution_id: str) -> Dict[str, Any]:
-    url = f"{BASE}/institutions/{institution_id}/"
-    r = requests.get(url, auth=auth, timeout=15)
-    r.raise_for_status()
-    return r.json()
+def _store_institutions(results: List[Dict[str, Any]], db: Optional[Session]) -> None:
+    if db is not None:
+        crud.upsert_institutions(db, results)
+        return
+    with SessionLocal() as db:
+        crud.upsert_institutions(db, results)
+
+async def fetch_all_institutions(per_page: int = 100) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    data = await _get_json("/institutions/", {"page_size": per_page})
+    while True:
+        results.extend(data.get("results", []))
+        if not data.get("next"):
+            return results
+        data = await _get_json(data["next"])
+
+async def sync_institutions(db: Session) -> Dict[str, int]:
+    """Refresca el catálogo completo con un único upsert en la base de datos."""
+    institutions = await fetch_all_institutions()
+    return await asyncio.to_thread(crud.upsert_institutions, db, institutions)
 
-def get_accounts_for_institution(institution_id: str, db: Session) -> Dict[str, Any]:
+async def get_accounts_for_institution(institution_id: str, db: Session, user_id: int) -> Dict[str, Any]:
     try:
-        institution = register_link_institution(institution_id, db)
+        institution = await register_link_institution(institution_id, db, user_id)
     except HTTPException as e:
         raise e
 
-    url = f"{BASE}/accounts/?link={institution['id']}"
     try:
-        r = requests.get(url, auth=auth, timeout=15)
+        r = await request("GET", "/accounts/", params={"link": institution["id"]})
         r.raise_for_status()
         return r.json()
-    except requests.exceptions.HTTPError:
+    except httpx.HTTPStatusError:
         try:
             error_data = r.json()
         except Exception:
@@ -65,194 +66,314 @@ def get_accounts_for_institution(institution_id: str, db: Session) -> Dict[str,
         raise HTTPException(status_code=r.status_code, detail=error_data)
 
 
-def register_link_institution(institution_id: str, db: Session) -> Dict[str, Any]:
-    institution = db.query(models.Institution).filter(models.Institution.name == institution_id).first()
-    if not institution:
-        raise HTTPException(status_code=404, detail="Institución no encontrada en la base de datos")
-    
-    existing_link: Optional[models.Link] = (
-        db.query(models.Link).filter(models.Link.institution == institution.name).first()
-    )
-    
-    if existing_link and existing_link.status == "valid":
-        return {
-            "id": existing_link.id,
-            "institution": existing_link.institution,
-            "status": existing_link.status,
-            "fetch_resources": existing_link.fetch_resources,
-        }
-    
-    form_fields = institution.form_fields or []
-    credentials = {}
-    for field in form_fields:
+async def find_institution_by_name(name: str, db: Session) -> Optional[Dict[str, Any]]:
+    """Busca la institución en el catálogo en memoria y, si no está, en la base de datos."""
+    institution = institution_cache.catalog.get_by_name(name)
+    if institution is not None:
+        return institution
+    institution = await asyncio.to_thread(_load_institution, db, name)
+    if institution is not None:
+        institution_cache.catalog.remember(institution)
+    return institution
+
+def _load_institution(db: Session, name: str) -> Optional[Dict[str, Any]]:
+    row = db.query(models.Institution).filter(models.Institution.name == name).first()
+    if row is None:
+        return None
+    return {"name": row.name, "form_fields": row.form_fields, "resources": row.resources}
+
+CredentialStep = Tuple[str, Callable[[], str]]
+
+_xeger = Xeger()
+
+
+def _pattern_generator(pattern: str) -> Callable[[], str]:
+    return lambda: _xeger.xeger(pattern)
+
+
+def _credential_steps(institution: Dict[str, Any]) -> List[CredentialStep]:
+    steps: List[CredentialStep] = []
+    for field in institution.get("form_fields") or []:
         name = field["name"]
-        pattern = field.get("validation")
-        credentials[name] = rstr.xeger(pattern) if pattern else "test123"
-        if field['type'] == 'select':
-            values = field.get("values", [])
-            if values:
-                pre_selected_index = field.get("pre_selected", 0)
-                credentials[name] = values[pre_selected_index]["code"]
-    
-    if institution.name == 'ofmockbank_br_retail':
-        credentials['username_type'] = "103"
-    
-    payload = {
-        "institution": institution.name,
-        "fetch_resources": institution.resources or ["ACCOUNTS", "TRANSACTIONS", "BALANCES"],
-        **credentials,
+        values = field.get("values", []) if field["type"] == "select" else []
+        if values:
+            code = values[field.get("pre_selected", 0)]["code"]
+            steps.append((name, lambda code=code: code))
+        elif field.get("validation"):
+            steps.append((name, _pattern_generator(field["validation"])))
+        else:
+            steps.append((name, lambda: "test123"))
+    if institution["name"] == 'ofmockbank_br_retail':
+        steps.append(("username_type", lambda: "103"))
+    return steps
+
+
+def generate_credentials(institution: Dict[str, Any]) -> Dict[str, str]:
+    """Credenciales de sandbox que cumplen las validaciones de cada campo del formulario."""
+    return {name: generate() for name, generate in _credential_steps(institution)}
+
+
+LinkKey = Tuple[int, str]
+
+# Links válidos por (user_id, institución); evita la consulta en cada llamada de KPIs.
+_link_cache: TTLCache = TTLCache(maxsize=settings.LINK_CACHE_MAXSIZE, ttl=settings.LINK_CACHE_TTL_SECONDS)
+# Registros en curso: las peticiones concurrentes por el mismo banco esperan al mismo.
+_link_registrations: Dict[LinkKey, asyncio.Task] = {}
+# Cada registro retiene una conexión (la del advisory lock) durante el POST a
+# Belvo; se limita cuántos corren a la vez para no agotar el pool.
+_registration_slots = asyncio.Semaphore(settings.LINK_REGISTRATION_CONCURRENCY)
+
+
+def _link_summary(link: models.Link) -> Dict[str, Any]:
+    return {
+        "id": link.id,
+        "institution": link.institution,
+        "status": link.status,
+        "fetch_resources": link.fetch_resources,
     }
-    
-    url = f"{BASE}/links/"
-    try:
-        r = requests.post(url, auth=auth, json=payload, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-    except requests.exceptions.HTTPError:
-        try:
-            error_data = r.json()
-        except Exception:
-            error_data = {"detail": "Error desconocido al registrar el link"}
-        raise HTTPException(status_code=r.status_code, detail=error_data)
-    
-    data['credentials'] = credentials
+
+
+def _find_valid_link(db: Session, user_id: int, institution: str) -> Optional[models.Link]:
+    return (
+        db.query(models.Link)
+        .filter(models.Link.user_id == user_id, models.Link.institution == institution, models.Link.status == "valid")
+        .first()
+    )
+
+
+def _valid_link_summary(db: Session, user_id: int, institution: str) -> Optional[Dict[str, Any]]:
+    """Resumen del link válido, si existe.
+
+    Termina la transacción de lectura para no retener la conexión mientras
+    quien llama espera a Belvo.
+    """
+    link = _find_valid_link(db, user_id, institution)
+    summary = _link_summary(link) if link is not None else None
+    db.rollback()
+    return summary
+
+
+def _advisory_lock_key(key: LinkKey) -> int:
+    digest = hashlib.sha1(f"link:{key[0]}:{key[1]}".encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+# Links cuyo uso ya se anotó hace poco en este proceso.
+_touched_links: TTLCache = TTLCache(maxsize=settings.LINK_CACHE_MAXSIZE, ttl=settings.LINK_TOUCH_INTERVAL_SECONDS)
+
+
+async def touch_link(link_id: str, db: AsyncSession) -> None:
+    """Anota que el usuario consultó el link, a lo sumo una vez por LINK_TOUCH_INTERVAL_SECONDS."""
+    if link_id in _touched_links:
+        return
+    _touched_links[link_id] = True
+    await db.execute(update(models.Link).where(models.Link.id == link_id).values(last_used_at=func.now()))
+    await db.commit()
+
+
+def invalidate_link_cache(user_id: int, institution: str) -> None:
+    _link_cache.pop((user_id, institution), None)
+
+
+invalidation.register("link", invalidate_link_cache)
+
+
+async def register_link_institution(institution_id: str, db: Session, user_id: int) -> Dict[str, Any]:
+    """Devuelve el link del usuario con la institución, creándolo en Belvo si no existe.
+
+    Es idempotente: en un mismo proceso las peticiones concurrentes comparten
+    el registro en curso, y entre procesos un advisory lock de Postgres
+    serializa la creación, así que se crea un solo link por banco.
+    """
+    key = (user_id, institution_id)
+    cached = _link_cache.get(key)
+    if cached is not None:
+        metrics.record_cache("links", "hit")
+        return cached
+    metrics.record_cache("links", "miss")
+
+    existing = await asyncio.to_thread(_valid_link_summary, db, user_id, institution_id)
+    if existing is not None:
+        _link_cache[key] = existing
+        return existing
+
+    task = _link_registrations.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_register_link(key))
+        _link_registrations[key] = task
+        task.add_done_callback(lambda _: _link_registrations.pop(key, None))
+    return await asyncio.shield(task)
+
+
+def _find_link(db: Session, user_id: int, institution: str) -> Optional[models.Link]:
+    return (
+        db.query(models.Link)
+        .filter(models.Link.user_id == user_id, models.Link.institution == institution)
+        .first()
+    )
+
+
+def _try_link_lock(db: Session, lock_key: int) -> bool:
+    return bool(db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": lock_key}).scalar())
+
+
+async def _lock_link(db: Session, key: LinkKey) -> None:
+    """Toma el advisory lock del link en la transacción de `db` sin bloquear el event loop.
+
+    pg_advisory_xact_lock dejaría el hilo esperando mientras otro proceso hace
+    su POST a Belvo; en su lugar se reintenta pg_try_advisory_xact_lock con
+    esperas crecientes hasta LINK_LOCK_TIMEOUT_SECONDS.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    lock_key = _advisory_lock_key(key)
+    deadline = time.monotonic() + settings.LINK_LOCK_TIMEOUT_SECONDS
+    delay = 0.05
+    while not await asyncio.to_thread(_try_link_lock, db, lock_key):
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=503,
+                detail="Hay otro registro en curso para este banco, intenta de nuevo",
+                headers={"Retry-After": "5"},
+            )
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+
+def _save_link(db: Session, existing_link: Optional[models.Link], data: Dict[str, Any], user_id: int) -> None:
     if existing_link:
-        for key, value in data.items():
-            if hasattr(existing_link, key):
-                setattr(existing_link, key, value)
+        for field, value in data.items():
+            if hasattr(existing_link, field):
+                setattr(existing_link, field, value)
     else:
         new_link = models.Link(**{k: v for k, v in data.items() if hasattr(models.Link, k)})
+        new_link.user_id = user_id
         db.add(new_link)
-    
     db.commit()
+
+
+async def _register_link(key: LinkKey) -> Dict[str, Any]:
+    async with _registration_slots:
+        return await _create_link(key)
+
+
+async def _create_link(key: LinkKey) -> Dict[str, Any]:
+    user_id, institution_id = key
+    db = SessionLocal()
+    try:
+        # Se libera con el commit/rollback de esta transacción.
+        await _lock_link(db, key)
+
+        existing_link = await asyncio.to_thread(_find_link, db, user_id, institution_id)
+        if existing_link and existing_link.status == "valid":
+            # Otro proceso lo creó mientras esperábamos el lock.
+            summary = _link_summary(existing_link)
+            await asyncio.to_thread(db.commit)
+            _link_cache[key] = summary
+            return summary
+
+        institution = await find_institution_by_name(institution_id, db)
+        if not institution:
+            raise HTTPException(status_code=404, detail="Institución no encontrada en la base de datos")
+
+        credentials = generate_credentials(institution)
+
+        payload = {
+            "institution": institution["name"],
+            "fetch_resources": institution.get("resources") or ["ACCOUNTS", "TRANSACTIONS", "BALANCES"],
+            **credentials,
+        }
+
+        try:
+            r = await request("POST", "/links/", json=payload)
+            r.raise_for_status()
+            data = r.json()
+        except httpx.HTTPStatusError:
+            try:
+                error_data = r.json()
+            except Exception:
+                error_data = {"detail": "Error desconocido al registrar el link"}
+            raise HTTPException(status_code=r.status_code, detail=error_data)
+
+        data['credentials'] = credentials
+        if existing_link:
+            # El link se re-registra: los KPIs calculados con el link anterior ya no valen.
+            await kpi_cache.invalidate_link(existing_link.id)
+        await asyncio.to_thread(_save_link, db, existing_link, data, user_id)
+        if existing_link:
+            # Otros workers pueden tener en caché el link anterior.
+            await invalidation.broadcast("link", user_id=user_id, institution=key[1])
+    finally:
+        # Cerrar hace rollback (y libera el lock) si no hubo commit: también va a un hilo.
+        await asyncio.to_thread(db.close)
+    if data.get("status") == "valid":
+        _link_cache[key] = {field: data.get(field) for field in ("id", "institution", "status", "fetch_resources")}
     return data
 
-def get_link_by_bank(bank_name: str, db: Session) -> str:
-    
-    link_entry: models.Link = db.query(models.Link).filter(models.Link.institution == bank_name).first()
-    if not link_entry:
-        raise HTTPException(status_code=404, detail=f"No se encontró un link para el banco {bank_name}")
-    return link_entry.id
-
-
-def get_account_kpis(account_id: str, link_id: str) -> Dict:
-    url = f"{BASE}/transactions/"
-    params = {"account": account_id, "link": link_id, "page_size": 1000}
-    r = requests.get(
-        url,
-        auth=HTTPBasicAuth(settings.BELVO_CLIENT_ID, settings.BELVO_SECRET),
-        params=params,
-        timeout=15
-    )
+async def get_link_by_bank_async(bank_name: str, db: AsyncSession, user_id: int) -> str:
+    """Id del link del usuario con el banco; además anota el uso del link."""
+    cached = _link_cache.get((user_id, bank_name))
+    if cached is not None:
+        metrics.record_cache("links", "hit")
+        link_id = cached["id"]
+    else:
+        metrics.record_cache("links", "miss")
+        result = await db.execute(
+            select(models.Link)
+            .where(models.Link.user_id == user_id, models.Link.institution == bank_name)
+            .limit(1)
+        )
+        link_entry: Optional[models.Link] = result.scalars().first()
+        if not link_entry:
+            raise HTTPException(status_code=404, detail=f"No se encontró un link para el banco {bank_name}")
+        if link_entry.status == "valid":
+            _link_cache[(user_id, bank_name)] = _link_summary(link_entry)
+        link_id = link_entry.id
+    await touch_link(link_id, db)
+    return link_id
+
 
+async def _get_json(url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    r = await request("GET", url, params=params)
     if r.status_code != 200:
         try:
             error_detail = r.json()
         except ValueError:
             error_detail = r.text
         raise HTTPException(status_code=r.status_code, detail=error_detail)
+    with metrics.stage("parse"):
+        return r.json()
 
-    data = r.json()
-    txs = data.get("results", [])
 
-    if not txs:
-        url = f"{BASE}/accounts/{account_id}/"
-        r = requests.get(
-            url,
-            auth=HTTPBasicAuth(settings.BELVO_CLIENT_ID, settings.BELVO_SECRET),
-            timeout=15
-        )
-        if r.status_code != 200:
-            try:
-                error_detail = r.json()
-            except ValueError:
-                error_detail = r.text
-            raise HTTPException(status_code=r.status_code, detail=error_detail)
-
-        data = r.json()
-        balance = data.get('balance',0)['current']
-        category = data.get('category')
-        account_currency = data.get('currency')
-
-        if category == 'PENSION_FUND_ACCOUNT':
-            funds_data = data.get('funds_data', [])
-            balance = sum(fd.get('balance', 0) for fd in funds_data)
-        return {
-            "balance": balance,
-            "ingresos": 0,
-            "ingresos_pendientes": 0,
-            "egresos": 0,
-            "egresos_pendientes": 0,
-            "aportes_netos": 0,
-            "ganancia_neta": 0,
-            "rentabilidad": 0,
-            "account_currency": account_currency,
-            "account_category": category,
-            "transactions": []
-        }
-    
-    account = txs[0]['account']
-    category = account.get('category')
-    account_currency = account.get('currency')
-
-    balance = 0
-    ingresos = egresos = ingresos_pendientes = egresos_pendientes = 0
-    aportes_netos = ganancia_neta = rentabilidad = 0
-
-    # -------------------------
-    # Pension Fund Accounts
-    # -------------------------
-    if category == "PENSION_FUND_ACCOUNT":
-        funds_data = account.get('funds_data', [])
-        balance = sum(fd.get('balance', 0) for fd in funds_data)
-
-        aportes = sum(t["amount"] for t in txs if t.get("type") == "INFLOW" and t.get("status") == "PROCESSED")
-        retiros = sum(abs(t["amount"]) for t in txs if t.get("type") == "OUTFLOW" and t.get("status") == "PROCESSED")
-
-        aportes_netos = aportes - retiros
-        ganancia_neta = balance - aportes_netos
-        rentabilidad = (ganancia_neta / aportes_netos * 100) if aportes_netos > 0 else 0
-
-    # -------------------------
-    # Credit Cards
-    # -------------------------
-    elif category == "CREDIT_CARD":
-        balance = account.get("balance", {}).get("current", 0)
-        ingresos = sum(t["amount"] for t in txs if t.get("type") == "INFLOW" and t.get("status") == "PROCESSED")
-        egresos = sum(abs(t["amount"]) for t in txs if t.get("type") == "OUTFLOW" and t.get("status") == "PROCESSED")
-        ingresos_pendientes = sum(t["amount"] for t in txs if t.get("type") == "INFLOW" and t.get("status") == "PENDING")
-        egresos_pendientes = sum(abs(t["amount"]) for t in txs if t.get("type") == "OUTFLOW" and t.get("status") == "PENDING")
-
-    # -------------------------
-    # Loan Accounts
-    # -------------------------
-    elif category == "LOAN_ACCOUNT":
-        balance = account.get("balance", {}).get("current", 0)
-        ingresos = sum(t["amount"] for t in txs if t.get("type") == "INFLOW" and t.get("status") == "PROCESSED")
-        ingresos_pendientes = sum(t["amount"] for t in txs if t.get("type") == "INFLOW" and t.get("status") == "PENDING")
-        egresos = sum(abs(t["amount"]) for t in txs if t.get("type") == "OUTFLOW" and t.get("status") == "PROCESSED")
-        egresos_pendientes = sum(abs(t["amount"]) for t in txs if t.get("type") == "OUTFLOW" and t.get("status") == "PENDING")
-
-    # -------------------------
-    # Checking / Savings Accounts
-    # -------------------------
-    else:
-        ingresos = sum(t["amount"] for t in txs if t.get("type") == "INFLOW" and t.get("status") == "PROCESSED")
-        ingresos_pendientes = sum(t["amount"] for t in txs if t.get("type") == "INFLOW" and t.get("status") == "PENDING")
-        egresos = sum(abs(t["amount"]) for t in txs if t.get("type") == "OUTFLOW" and t.get("status") == "PROCESSED")
-        egresos_pendientes = sum(abs(t["amount"]) for t in txs if t.get("type") == "OUTFLOW" and t.get("status") == "PENDING")
-        balance = account.get("balance", {}).get("current", ingresos - egresos)
+async def iter_transaction_pages(
+    account_id: str, link_id: str, filters: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Recorre todas las páginas de /transactions/ siguiendo el cursor `next`.
 
-    return {
-        "balance": balance,
-        "ingresos": ingresos,
-        "ingresos_pendientes": ingresos_pendientes,
-        "egresos": egresos,
-        "egresos_pendientes": egresos_pendientes,
-        "account_currency": account_currency,
-        "account_category": category,
-        "aportes_netos": aportes_netos,
-        "ganancia_neta": ganancia_neta,
-        "rentabilidad": rentabilidad,
-        "transactions": txs
-    }
\ No newline at end of file
+    La página siguiente se pide mientras el consumidor procesa la actual.
+    """
+    params = {"account": account_id, "link": link_id, "page_size": settings.BELVO_TRANSACTIONS_PAGE_SIZE, **(filters or {})}
+    fetch: Optional[asyncio.Future] = asyncio.ensure_future(_get_json("/transactions/", params))
+    try:
+        while fetch is not None:
+            data = await fetch
+            next_url = data.get("next")
+            fetch = asyncio.ensure_future(_get_json(next_url)) if next_url else None
+            yield data.get("results", [])
+    finally:
+        if fetch is not None:
+            fetch.cancel()
+
+
+async def get_account(account_id: str) -> Dict[str, Any]:
+    return await _get_json(f"/accounts/{account_id}/")
+
+
+async def list_link_accounts(link_id: str) -> List[Dict[str, Any]]:
+    accounts: List[Dict[str, Any]] = []
+    data = await _get_json("/accounts/", {"link": link_id})
+    accounts.extend(data.get("results", []))
+    while data.get("next"):
+        data = await _get_json(data["next"])
+        accounts.extend(data.get("results", []))
+    return accounts
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from typing import Any, Optional
+
+import httpx
+
+from app import metrics
+from app.config import per_worker, settings
+from app.resilience import (
+    CircuitBreaker,
+    TokenBucket,
+    UpstreamUnavailable,
+    backoff_delay,
+    parse_retry_after,
+)
+
+BASE = settings.BELVO_BASE_URL.rstrip("/")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.BELVO_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.BELVO_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.BELVO_HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        settings.BELVO_HTTP_TIMEOUT,
+        connect=settings.BELVO_HTTP_CONNECT_TIMEOUT,
+        pool=settings.BELVO_HTTP_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(
+        base_url=BASE,
+        auth=(settings.BELVO_CLIENT_ID, settings.BELVO_SECRET),
+        limits=limits,
+        timeout=timeout,
+        headers={"Accept": "application/json"},
+    )
+
+
+async def startup() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def shutdown() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    # Fuera del lifespan (scripts, shell) el cliente se crea bajo demanda.
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Errores en los que la petición no llegó a Belvo: se pueden reintentar incluso en un POST.
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# El límite con Belvo es de la instancia: cada worker recibe su parte.
+rate_limiter = TokenBucket(
+    rate=settings.BELVO_RATE_LIMIT_PER_SECOND / (settings.WEB_CONCURRENCY or 1),
+    capacity=per_worker(settings.BELVO_RATE_LIMIT_BURST),
+)
+breaker = CircuitBreaker(
+    failure_threshold=settings.BELVO_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.BELVO_CIRCUIT_RESET_SECONDS,
+)
+
+_BASE_PATH = httpx.URL(BASE).path.rstrip("/")
+
+
+def endpoint_for(url: str) -> str:
+    """Nombre del recurso de Belvo (institutions, links, accounts, ...) para una URL."""
+    path = httpx.URL(url).path
+    if _BASE_PATH and path.startswith(_BASE_PATH + "/"):
+        path = path[len(_BASE_PATH):]
+    return path.strip("/").split("/")[0] or "root"
+
+
+def _timeout_for(endpoint: str) -> httpx.Timeout:
+    seconds = settings.BELVO_ENDPOINT_TIMEOUTS.get(endpoint, settings.BELVO_HTTP_TIMEOUT)
+    return httpx.Timeout(seconds, connect=settings.BELVO_HTTP_CONNECT_TIMEOUT, pool=settings.BELVO_HTTP_POOL_TIMEOUT)
+
+
+def _observe(endpoint: str, method: str, status: str, start: float) -> None:
+    elapsed = time.perf_counter() - start
+    metrics.UPSTREAM_LATENCY.labels(endpoint=endpoint, method=method.upper(), status=status).observe(elapsed)
+    metrics.record_stage("belvo", elapsed)
+
+
+async def _send(method: str, url: str, endpoint: str, **kwargs: Any) -> httpx.Response:
+    """Un intento: pasa por el circuit breaker y el limitador y registra el resultado.
+
+    Si el intento no llega a tener resultado (se cancela esperando turno o la
+    respuesta), la llamada de prueba del circuito semiabierto se libera; de lo
+    contrario el circuito rechazaría todas las llamadas para siempre.
+    """
+    probe = breaker.before_call()
+    try:
+        await rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = await get_client().request(method, url, **kwargs)
+        except httpx.TransportError as exc:
+            _observe(endpoint, method, exc.__class__.__name__, start)
+            breaker.record_failure()
+            raise
+    except BaseException:
+        if probe:
+            breaker.release_probe()
+        raise
+
+    _observe(endpoint, method, str(response.status_code), start)
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+async def request(method: str, url: str, **kwargs: Any) -> httpx.Response:
+    """Petición a Belvo con limitador, reintentos, timeout por recurso y circuit breaker.
+
+    Los 429 y los errores de red/5xx se reintentan con backoff exponencial con
+    jitter, respetando Retry-After; los métodos no idempotentes sólo se
+    reintentan si la petición no llegó a enviarse o Belvo respondió 429. Si se
+    agotan los reintentos se devuelve la última respuesta, o UpstreamUnavailable
+    si no hubo ninguna.
+    """
+    endpoint = endpoint_for(url)
+    kwargs.setdefault("timeout", _timeout_for(endpoint))
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    attempt = 0
+    while True:
+        try:
+            response = await _send(method, url, endpoint, **kwargs)
+        except httpx.TransportError as exc:
+            if attempt >= settings.BELVO_MAX_RETRIES or not (idempotent or isinstance(exc, NOT_SENT_ERRORS)):
+                status_code = 504 if isinstance(exc, httpx.TimeoutException) else 503
+                raise UpstreamUnavailable(
+                    f"Error de comunicación con Belvo ({endpoint}): {exc.__class__.__name__}", status_code=status_code
+                ) from exc
+            await asyncio.sleep(backoff_delay(attempt, settings.BELVO_RETRY_BASE_DELAY, settings.BELVO_RETRY_MAX_DELAY))
+            attempt += 1
+            continue
+
+        if response.status_code not in RETRYABLE_STATUS:
+            return response
+        if attempt >= settings.BELVO_MAX_RETRIES or not (idempotent or response.status_code == 429):
+            return response
+
+        delay = backoff_delay(attempt, settings.BELVO_RETRY_BASE_DELAY, settings.BELVO_RETRY_MAX_DELAY)
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            if retry_after > settings.BELVO_RETRY_MAX_DELAY:
+                return response
+            delay = max(delay, retry_after)
+        await response.aclose()
+        await asyncio.sleep(delay)
+        attempt += 1
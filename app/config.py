@@ -1,16 +1,107 @@
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # Conexiones por instancia, repartidas entre sus workers (ver database._pool_options).
+    DB_POOL_SIZE: int = 8
+    DB_MAX_OVERFLOW: int = 12
+    DB_ASYNC_POOL_SIZE: int = 4
+    DB_ASYNC_MAX_OVERFLOW: int = 4
+    DB_POOL_TIMEOUT: float = 10.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_QUERY_CACHE_SIZE: int = 1200
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 256
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    ACCESS_TOKEN_INCLUDE_USER_ID: bool = True
+    AUTH_USER_CACHE_TTL_SECONDS: int = 300
+    AUTH_USER_CACHE_MAXSIZE: int = 10000
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32
     BELVO_CLIENT_ID: str
     BELVO_SECRET: str
     BELVO_BASE_URL: str = "https://sandbox.belvo.com/api"
     AMMPER_USER: str 
     AMMPER_PASSWORD: str 
+    BELVO_HTTP_MAX_CONNECTIONS: int = 100
+    BELVO_HTTP_MAX_KEEPALIVE: int = 20
+    BELVO_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    BELVO_HTTP_TIMEOUT: float = 15.0
+    BELVO_HTTP_CONNECT_TIMEOUT: float = 5.0
+    BELVO_HTTP_POOL_TIMEOUT: float = 5.0
+    BELVO_ENDPOINT_TIMEOUTS: Dict[str, float] = {"institutions": 10.0, "accounts": 15.0, "transactions": 30.0, "links": 60.0}
+    BELVO_RATE_LIMIT_PER_SECOND: float = 10.0
+    BELVO_RATE_LIMIT_BURST: int = 20
+    BELVO_MAX_RETRIES: int = 3
+    BELVO_RETRY_BASE_DELAY: float = 0.2
+    BELVO_RETRY_MAX_DELAY: float = 10.0
+    BELVO_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    BELVO_CIRCUIT_RESET_SECONDS: float = 30.0
+    BELVO_TRANSACTIONS_PAGE_SIZE: int = 1000
+    TRANSACTION_SYNC_INTERVAL_SECONDS: int = 300
+    TRANSACTION_SYNC_OVERLAP_DAYS: int = 7
+    INSTITUTION_CACHE_TTL_SECONDS: int = 3600
+    INSTITUTION_CACHE_STALE_SECONDS: int = 86400
+    INSTITUTION_CACHE_MAXSIZE: int = 64
+    KPI_CACHE_BACKEND: str = "memory"
+    KPI_CACHE_TTL_SECONDS: float = 30.0
+    KPI_CACHE_MAXSIZE: int = 10000
+    KPI_SERIES_MAX_PERIODS: int = 1000
+    DASHBOARD_CONCURRENCY: int = 8
+    LINK_CACHE_TTL_SECONDS: int = 600
+    LINK_CACHE_MAXSIZE: int = 10000
+    LINK_LOCK_TIMEOUT_SECONDS: float = 120.0
+    LINK_REGISTRATION_CONCURRENCY: int = 4
+    LINK_TOUCH_INTERVAL_SECONDS: int = 300
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    ONBOARDING_CONCURRENCY: int = 8
+    ONBOARDING_MAX_INSTITUTIONS: int = 100
+    ONBOARDING_SSE_POLL_SECONDS: float = 1.0
+    BELVO_WEBHOOK_AUTHORIZATION: Optional[str] = None
+    WEBHOOK_QUEUE_SIZE: int = 1000
+    WEBHOOK_WORKERS: int = 4
+    WEBHOOK_DEDUP_TTL_SECONDS: float = 3600.0
+    HOST: str = "0.0.0.0"
+    PORT: int = 8080
+    WEB_CONCURRENCY: Optional[int] = None
+    WEB_MAX_WORKERS: int = 4
+    KEEPALIVE_TIMEOUT_SECONDS: int = 75
+    # Se suman al apagar y deben quedar por debajo del kill_timeout de fly.toml (30s).
+    SHUTDOWN_READINESS_DELAY_SECONDS: float = 5.0
+    GRACEFUL_SHUTDOWN_SECONDS: int = 15
+    ACCESS_LOG: bool = False
+    WARMUP_DB_CONNECTIONS: int = 2
+    WARMUP_TIMEOUT_SECONDS: float = 10.0
+    READINESS_DB_TIMEOUT_SECONDS: float = 2.0
+    SHUTDOWN_DRAIN_SECONDS: float = 5.0
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_LEADER_ELECTION: bool = True
+    SCHEDULER_INTERVAL_SECONDS: float = 60.0
+    SCHEDULER_JITTER_SECONDS: float = 30.0
+    SCHEDULER_CONCURRENCY: int = 2
+    SCHEDULER_MAX_LINKS_PER_TICK: int = 50
+    SCHEDULER_REFRESH_AHEAD_RATIO: float = 0.8
+    SCHEDULER_DEFAULT_REFRESH_SECONDS: int = 21600
+    SCHEDULER_RETRY_SECONDS: int = 900
+    SCHEDULER_IDLE_LINK_SECONDS: int = 604800
 
     class Config:
         env_file = ".env"
 
 settings = Settings()
+
+
+def per_worker(total: int) -> int:
+    """Parte de un límite de toda la instancia que le toca a cada worker.
+
+    app.server exporta WEB_CONCURRENCY a los workers; fuera de él hay uno solo.
+    """
+    if total <= 0:
+        return total
+    return max(1, total // (settings.WEB_CONCURRENCY or 1))
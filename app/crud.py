@@ -1,22 +1,77 @@
+import hashlib
+import json
+from typing import Dict, Iterable
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app import models
-from app.auth import get_password_hash, verify_password
+from app.auth import get_password_hash_async, verify_password_async
 
-def create_user(db: Session, username: str, password: str):
-    hashed = get_password_hash(password)
+async def create_user(db: AsyncSession, username: str, password: str):
+    hashed = await get_password_hash_async(password)
     user = models.User(username=username, hashed_password=hashed)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user_by_username(db, username)
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username_async(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_password_async(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
+
+
+async def get_user_by_username_async(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).where(models.User.username == username).limit(1))
+    return result.scalars().first()
+
+
+INSTITUTION_COLUMNS = [c.name for c in models.Institution.__table__.columns if c.name != "content_hash"]
+
+
+def _institution_row(inst: dict) -> dict:
+    row = {key: inst.get(key) for key in INSTITUTION_COLUMNS}
+    row["id"] = str(inst["id"])
+    payload = json.dumps(row, sort_keys=True, default=str).encode()
+    row["content_hash"] = hashlib.sha256(payload).hexdigest()
+    return row
+
+
+def upsert_institutions(db: Session, institutions: Iterable[dict]) -> Dict[str, int]:
+    """Inserta o actualiza el catálogo en una sola sentencia INSERT ... ON CONFLICT.
+
+    Las filas cuyo content_hash no cambió no se reescriben.
+    """
+    rows = {}
+    for inst in institutions:
+        row = _institution_row(inst)
+        rows[row["id"]] = row
+    if not rows:
+        return {"inserted": 0, "updated": 0, "skipped": 0}
+
+    stmt = insert(models.Institution).values(list(rows.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Institution.id],
+        set_={key: stmt.excluded[key] for key in INSTITUTION_COLUMNS + ["content_hash"] if key != "id"},
+        where=models.Institution.content_hash.is_distinct_from(stmt.excluded.content_hash),
+    ).returning(models.Institution.id, literal_column("xmax = 0").label("inserted"))
+    written = db.execute(stmt).all()
+    db.commit()
+
+    inserted = sum(1 for row in written if row.inserted)
+    return {
+        "inserted": inserted,
+        "updated": len(written) - inserted,
+        "skipped": len(rows) - len(written),
+    }
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app import belvo_client, models, transaction_store
+from app.config import settings
+from app.database import SessionLocal, async_session
+from app.kpi_cache import kpi_cache
+
+logger = logging.getLogger(__name__)
+
+SUMMED_KPIS = ("balance", "ingresos", "ingresos_pendientes", "egresos", "egresos_pendientes")
+
+
+def error_payload(exc: Exception) -> Dict[str, Any]:
+    if isinstance(exc, HTTPException):
+        return {"status_code": exc.status_code, "detail": exc.detail}
+    if isinstance(exc, httpx.HTTPError):
+        return {"status_code": 502, "detail": str(exc) or exc.__class__.__name__}
+    # Errores internos (base de datos, bugs): no se exponen sus detalles.
+    return {"status_code": 500, "detail": "Error interno"}
+
+
+def linked_banks(db: Session, user_id: int) -> List[str]:
+    rows = (
+        db.query(models.Link.institution)
+        .filter(models.Link.user_id == user_id, models.Link.status == "valid")
+        .distinct()
+        .all()
+    )
+    return [institution for (institution,) in rows]
+
+
+async def build_dashboard(banks: List[str], user_id: int) -> Dict[str, Any]:
+    """KPIs de todas las cuentas de los bancos indicados en una sola respuesta.
+
+    Los KPIs salen del almacén local de transacciones, igual que en
+    /account/{id}/kpis, y comparten su caché. Bancos y cuentas se procesan en
+    paralelo con a lo sumo DASHBOARD_CONCURRENCY a la vez. Un banco o una
+    cuenta que falla, por la razón que sea, aparece con su error en lugar de
+    tumbar toda la respuesta.
+    """
+    semaphore = asyncio.Semaphore(settings.DASHBOARD_CONCURRENCY)
+
+    async def bank_accounts(bank: str):
+        # Sesión propia por banco: las tareas concurrentes no comparten transacción.
+        db = SessionLocal()
+        try:
+            async with semaphore:
+                data = await belvo_client.get_accounts_for_institution(bank, db, user_id)
+        finally:
+            await asyncio.to_thread(db.close)
+        async with async_session() as adb:
+            link_id = await belvo_client.get_link_by_bank_async(bank, adb, user_id)
+        return link_id, data.get("results", [])
+
+    async def account_kpis(bank: str, link_id: str, account: Dict[str, Any]):
+        entry = {
+            "bank": bank,
+            "account_id": account["id"],
+            "name": account.get("name"),
+            "category": account.get("category"),
+            "currency": account.get("currency"),
+        }
+
+        async def compute():
+            async with semaphore:
+                return await transaction_store.synced_kpis(account["id"], link_id)
+
+        try:
+            entry["kpis"] = await kpi_cache.get_or_compute(account["id"], link_id, compute)
+        except Exception as exc:
+            if not isinstance(exc, (HTTPException, httpx.HTTPError)):
+                logger.exception("No se pudieron calcular los KPIs de %s", account["id"])
+            entry["error"] = error_payload(exc)
+        return entry
+
+    bank_results = await asyncio.gather(*(bank_accounts(bank) for bank in banks), return_exceptions=True)
+
+    bank_errors = []
+    tasks = []
+    for bank, result in zip(banks, bank_results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result
+            if not isinstance(result, (HTTPException, httpx.HTTPError)):
+                logger.error("No se pudieron obtener las cuentas de %s", bank, exc_info=result)
+            bank_errors.append({"bank": bank, "error": error_payload(result)})
+            continue
+        link_id, accounts = result
+        tasks.extend(account_kpis(bank, link_id, account) for account in accounts)
+    accounts = await asyncio.gather(*tasks)
+
+    totals: Dict[Optional[str], Dict[str, float]] = {}
+    for entry in accounts:
+        if "kpis" not in entry:
+            continue
+        kpis = entry["kpis"]
+        currency_totals = totals.setdefault(kpis.get("account_currency"), dict.fromkeys(SUMMED_KPIS, 0))
+        for field in SUMMED_KPIS:
+            currency_totals[field] += kpis.get(field) or 0
+
+    return {
+        "accounts": accounts,
+        "bank_errors": bank_errors,
+        "totals": totals,
+    }
@@ -1,8 +1,40 @@
+from typing import AsyncIterator, Optional
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from app.config import settings
+from app.config import per_worker, settings
+
+def _pool_options(url: URL, pool_size: int, max_overflow: int) -> dict:
+    """Opciones de QueuePool con la parte de este worker de un presupuesto de la instancia.
+
+    Cada engine tiene su propio presupuesto (DB_POOL_SIZE/DB_MAX_OVERFLOW el
+    síncrono, DB_ASYNC_POOL_SIZE/DB_ASYNC_MAX_OVERFLOW el async). El máximo de
+    conexiones de una instancia es la suma de ambos más, por worker, la de
+    LISTEN de invalidaciones, la del líder del scheduler y las de los locks
+    de trabajos de alta masiva en curso.
+    """
+    # SQLite (desarrollo local) no usa QueuePool y rechaza estas opciones.
+    if url.get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": per_worker(pool_size),
+        "max_overflow": per_worker(max_overflow),
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
 
-engine = create_engine(settings.DATABASE_URL, echo=False, future=True)
+
+_url = make_url(settings.DATABASE_URL)
+engine = create_engine(
+    _url,
+    echo=False,
+    future=True,
+    query_cache_size=settings.DB_QUERY_CACHE_SIZE,
+    **_pool_options(_url, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW),
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -12,3 +44,54 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def async_database_url() -> URL:
+    if settings.ASYNC_DATABASE_URL:
+        return make_url(settings.ASYNC_DATABASE_URL)
+    url = make_url(settings.DATABASE_URL)
+    if url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url
+
+
+_async_engine: Optional[AsyncEngine] = None
+_async_sessionmaker: Optional[async_sessionmaker] = None
+
+
+def get_async_engine() -> AsyncEngine:
+    # Se crea bajo demanda para que importar la app no requiera el driver async.
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        url = async_database_url()
+        connect_args = {}
+        if url.get_driver_name() == "asyncpg":
+            # Caché de sentencias preparadas por conexión en asyncpg.
+            connect_args["prepared_statement_cache_size"] = settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+        _async_engine = create_async_engine(
+            url,
+            echo=False,
+            query_cache_size=settings.DB_QUERY_CACHE_SIZE,
+            connect_args=connect_args,
+            **_pool_options(url, settings.DB_ASYNC_POOL_SIZE, settings.DB_ASYNC_MAX_OVERFLOW),
+        )
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+    return _async_engine
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_sessionmaker = None
+
+
+def async_session() -> AsyncSession:
+    get_async_engine()
+    return _async_sessionmaker()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with async_session() as db:
+        yield db
@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional
+
+
+def _split(value: Optional[str]) -> FrozenSet[str]:
+    return frozenset(part.strip() for part in (value or "").split(",") if part.strip())
+
+
+@dataclass(frozen=True)
+class FieldSelection:
+    """Campos pedidos por el cliente con `?fields=a,b` y/o `?exclude=c`."""
+    fields: Optional[FrozenSet[str]] = None
+    exclude: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def parse(cls, fields: Optional[str] = None, exclude: Optional[str] = None) -> "FieldSelection":
+        return cls(fields=_split(fields) or None, exclude=_split(exclude))
+
+    @property
+    def is_all(self) -> bool:
+        return self.fields is None and not self.exclude
+
+    def includes(self, name: str) -> bool:
+        return name not in self.exclude and (self.fields is None or name in self.fields)
+
+    def apply(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        if self.is_all:
+            return item
+        return {key: value for key, value in item.items() if self.includes(key)}
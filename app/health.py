@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import text
+
+from app import institution_cache
+from app.config import per_worker, settings
+from app.database import engine, get_async_engine
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceState:
+    """Listo tras el calentamiento; deja de estarlo al empezar el apagado."""
+
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+
+
+state = ServiceState()
+
+
+def _warm_sync_pool(connections: int) -> None:
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            conn.close()
+
+
+async def _warm_async_pool(connections: int) -> None:
+    async def ping():
+        async with get_async_engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+
+async def warm_up() -> None:
+    """Abre conexiones del pool y trae la primera página del catálogo antes de recibir tráfico.
+
+    Un fallo aquí se registra pero no impide arrancar: la primera petición
+    pagará el costo como antes.
+    """
+    steps = {
+        "db": asyncio.to_thread(_warm_sync_pool, min(settings.WARMUP_DB_CONNECTIONS, per_worker(settings.DB_POOL_SIZE))),
+        "db_async": _warm_async_pool(min(settings.WARMUP_DB_CONNECTIONS, per_worker(settings.DB_ASYNC_POOL_SIZE))),
+        # También deja abierta una conexión keep-alive con Belvo.
+        "catalog": institution_cache.catalog.get_page(page=1),
+    }
+    results = await asyncio.gather(
+        *(asyncio.wait_for(step, timeout=settings.WARMUP_TIMEOUT_SECONDS) for step in steps.values()),
+        return_exceptions=True,
+    )
+    for name, result in zip(steps, results):
+        if isinstance(result, BaseException):
+            logger.warning("Calentamiento de %s fallido: %r", name, result)
+
+
+async def readiness() -> Tuple[bool, Dict[str, Any]]:
+    checks: Dict[str, Any] = {"warmed_up": state.ready, "draining": state.draining}
+    try:
+        async with get_async_engine().connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), timeout=settings.READINESS_DB_TIMEOUT_SECONDS)
+        checks["database"] = "ok"
+    except Exception as exc:
+        checks["database"] = exc.__class__.__name__
+    ok = state.ready and not state.draining and checks["database"] == "ok"
+    return ok, checks
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+from cachetools import LRUCache, TTLCache
+
+from app import belvo_client, invalidation, metrics
+from app.config import settings
+from app.fields import FieldSelection
+
+logger = logging.getLogger(__name__)
+
+PageKey = Tuple[Tuple[str, Any], ...]
+
+
+@dataclass
+class CatalogPage:
+    payload: Dict[str, Any]
+    body: bytes
+    etag: str
+    fetched_at: float
+    # Cuerpo y ETag por selección de campos; la página rara vez cambia.
+    projections: LRUCache = field(default_factory=lambda: LRUCache(maxsize=16))
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def render(self, selection: FieldSelection) -> Tuple[bytes, str]:
+        """Cuerpo y ETag de la página con sólo los campos pedidos de cada institución."""
+        if selection.is_all:
+            return self.body, self.etag
+        rendered = self.projections.get(selection)
+        if rendered is None:
+            payload = self.payload
+            if isinstance(payload, dict):
+                payload = {**payload, "results": [selection.apply(i) for i in payload.get("results", [])]}
+            else:
+                payload = [selection.apply(i) for i in payload]
+            body = orjson.dumps(payload)
+            rendered = self.projections[selection] = (body, _etag(body))
+        return rendered
+
+
+def _etag(body: bytes) -> str:
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+class InstitutionCache:
+    """Catálogo de instituciones en memoria por página/filtros.
+
+    Una página con menos de `ttl` segundos se sirve tal cual; hasta `ttl + stale`
+    se sirve la copia vieja y se refresca en segundo plano; después se espera
+    al refresco. Las peticiones concurrentes por la misma página comparten
+    una única llamada a Belvo.
+    """
+
+    def __init__(self, ttl: float, stale: float, maxsize: int):
+        self.ttl = ttl
+        self.stale = stale
+        self._pages: LRUCache = LRUCache(maxsize=maxsize)
+        self._by_name: TTLCache = TTLCache(maxsize=10_000, ttl=ttl + stale)
+        self._inflight: Dict[PageKey, asyncio.Task] = {}
+
+    @staticmethod
+    def key(**filters: Any) -> PageKey:
+        return tuple(sorted(filters.items()))
+
+    async def get_page(self, page: int = 1, per_page: int = 50) -> CatalogPage:
+        key = self.key(page=page, per_page=per_page)
+        entry: Optional[CatalogPage] = self._pages.get(key)
+        if entry is not None:
+            if entry.age < self.ttl:
+                metrics.record_cache("institutions", "hit")
+                return entry
+            if entry.age < self.ttl + self.stale:
+                metrics.record_cache("institutions", "stale")
+                self._refresh_in_background(key)
+                return entry
+        metrics.record_cache("institutions", "miss")
+        try:
+            return await self._refresh(key)
+        except Exception:
+            # Belvo degradado: mejor un catálogo viejo que un error.
+            if entry is None:
+                raise
+            logger.warning("Sirviendo catálogo vencido para %s", key)
+            return entry
+
+    def get_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._by_name.get(name)
+
+    def remember(self, institution: Dict[str, Any]) -> None:
+        if institution.get("name"):
+            self._by_name[institution["name"]] = institution
+
+    def clear(self) -> None:
+        self._pages.clear()
+        self._by_name.clear()
+
+    async def _refresh(self, key: PageKey) -> CatalogPage:
+        # shield: si quien espera se cancela, el refresco compartido sigue.
+        return await asyncio.shield(self._start(key))
+
+    def _refresh_in_background(self, key: PageKey) -> None:
+        self._start(key)
+
+    def _start(self, key: PageKey) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return task
+
+    def _finished(self, key: PageKey, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("No se pudo refrescar el catálogo de instituciones: %r", task.exception())
+
+    async def _load(self, key: PageKey) -> CatalogPage:
+        params = dict(key)
+        payload = await belvo_client.list_institutions(page=params["page"], per_page=params["per_page"])
+        body = orjson.dumps(payload)
+        entry = CatalogPage(
+            payload=payload,
+            body=body,
+            etag=_etag(body),
+            fetched_at=time.monotonic(),
+        )
+        self._pages[key] = entry
+        results = payload.get("results", payload) if isinstance(payload, dict) else payload
+        for institution in results:
+            self.remember(institution)
+        return entry
+
+
+catalog = InstitutionCache(
+    ttl=settings.INSTITUTION_CACHE_TTL_SECONDS,
+    stale=settings.INSTITUTION_CACHE_STALE_SECONDS,
+    maxsize=settings.INSTITUTION_CACHE_MAXSIZE,
+)
+invalidation.register("catalog", catalog.clear)
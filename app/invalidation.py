@@ -0,0 +1,111 @@
+"""Invalidación de cachés en memoria entre workers e instancias.
+
+Cada proceso guarda en memoria links, usuarios, KPIs y el catálogo. Quien
+invalida algo lo borra en su proceso y lo publica con NOTIFY en Postgres; el
+resto lo recibe con LISTEN y lo borra en el suyo. Mientras el listener está
+desconectado las cachés siguen expirando por su TTL.
+"""
+import asyncio
+import inspect
+import logging
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.database import async_database_url, get_async_engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+
+# Identifica los mensajes de este proceso, que ya invalidó su caché.
+_origin = uuid.uuid4().hex
+_handlers: Dict[str, Callable[..., Any]] = {}
+_listener: Optional[asyncio.Task] = None
+
+
+def register(kind: str, handler: Callable[..., Any]) -> None:
+    """Registra cómo se aplica en este proceso una invalidación de tipo `kind`."""
+    _handlers[kind] = handler
+
+
+def _enabled() -> bool:
+    return async_database_url().get_backend_name() == "postgresql"
+
+
+def _payload(kind: str, values: Dict[str, Any]) -> str:
+    return orjson.dumps({"origin": _origin, "kind": kind, "values": values}).decode()
+
+
+def notify(connection: Connection, kind: str, **values: Any) -> None:
+    """Publica dentro de la transacción de `connection`: sólo se envía si hace commit."""
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": _payload(kind, values)})
+
+
+async def broadcast(kind: str, **values: Any) -> None:
+    """Publica la invalidación para los demás procesos; un fallo sólo se registra."""
+    if not _enabled():
+        return
+    try:
+        async with get_async_engine().begin() as conn:
+            await conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": _payload(kind, values)})
+    except Exception:
+        logger.warning("No se pudo publicar la invalidación %s", kind, exc_info=True)
+
+
+def _dispatch(_connection: Any, _pid: int, _channel: str, payload: str) -> None:
+    try:
+        message = orjson.loads(payload)
+        if message["origin"] == _origin:
+            return
+        handler = _handlers.get(message["kind"])
+        if handler is None:
+            return
+        result = handler(**message["values"])
+        if inspect.isawaitable(result):
+            asyncio.ensure_future(result)
+    except Exception:
+        logger.warning("Invalidación inválida: %r", payload, exc_info=True)
+
+
+async def _listen() -> None:
+    import asyncpg
+
+    dsn = async_database_url().set(drivername="postgresql").render_as_string(hide_password=False)
+    delay = 1.0
+    while True:
+        try:
+            conn = await asyncpg.connect(dsn)
+        except Exception:
+            logger.warning("Sin conexión para escuchar invalidaciones; reintento en %.0fs", delay, exc_info=True)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+            continue
+        delay = 1.0
+        lost = asyncio.Event()
+        conn.add_termination_listener(lambda _: lost.set())
+        try:
+            await conn.add_listener(CHANNEL, _dispatch)
+            await lost.wait()
+            logger.warning("Se perdió la conexión de invalidaciones; reconectando")
+        finally:
+            if not conn.is_closed():
+                await conn.close(timeout=5)
+
+
+def start() -> None:
+    global _listener
+    if _enabled() and _listener is None:
+        _listener = asyncio.ensure_future(_listen())
+
+
+async def stop() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        await asyncio.gather(_listener, return_exceptions=True)
+        _listener = None
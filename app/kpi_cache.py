@@ -0,0 +1,119 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from cachetools import LRUCache
+
+from app import invalidation, metrics
+from app.config import settings
+
+
+class CacheBackend(ABC):
+    """Interfaz mínima de almacenamiento; un backend Redis la implementaría con GET/SETEX/SCAN+DEL."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str) -> int:
+        ...
+
+
+class MemoryBackend(CacheBackend):
+    """LRU en memoria con expiración por entrada."""
+
+    def __init__(self, maxsize: int):
+        self._data: LRUCache = LRUCache(maxsize=maxsize)
+
+    async def get(self, key: str) -> Optional[Any]:
+        item: Optional[Tuple[float, Any]] = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        keys = [k for k in self._data.keys() if k.startswith(prefix)]
+        for k in keys:
+            self._data.pop(k, None)
+        return len(keys)
+
+
+class KpiCache:
+    """Caché de KPIs por (account_id, link_id) con coalescencia de peticiones.
+
+    Las peticiones concurrentes por la misma clave esperan a un único cálculo.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def key(account_id: str, link_id: str) -> str:
+        return f"kpis:{link_id}:{account_id}"
+
+    async def get_or_compute(
+        self, account_id: str, link_id: str, compute: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        key = self.key(account_id, link_id)
+        value = await self.backend.get(key)
+        if value is not None:
+            metrics.record_cache("kpis", "hit")
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.record_cache("kpis", "coalesced")
+        else:
+            metrics.record_cache("kpis", "miss")
+            task = asyncio.ensure_future(self._compute(key, compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        value = await compute()
+        await self.backend.set(key, value, self.ttl)
+        return value
+
+    async def invalidate_account(self, account_id: str, link_id: str) -> None:
+        await self.backend.delete(self.key(account_id, link_id))
+        await invalidation.broadcast("kpi_account", account_id=account_id, link_id=link_id)
+
+    async def invalidate_link(self, link_id: str) -> int:
+        removed = await self.backend.delete_prefix(f"kpis:{link_id}:")
+        await invalidation.broadcast("kpi_link", link_id=link_id)
+        return removed
+
+
+def _build_backend() -> CacheBackend:
+    if settings.KPI_CACHE_BACKEND == "memory":
+        return MemoryBackend(maxsize=settings.KPI_CACHE_MAXSIZE)
+    raise ValueError(f"KPI_CACHE_BACKEND desconocido: {settings.KPI_CACHE_BACKEND}")
+
+
+kpi_cache = KpiCache(_build_backend(), ttl=settings.KPI_CACHE_TTL_SECONDS)
+# Invalidaciones hechas por otros workers: sólo se borra en la caché local.
+invalidation.register("kpi_account", lambda account_id, link_id: kpi_cache.backend.delete(KpiCache.key(account_id, link_id)))
+invalidation.register("kpi_link", lambda link_id: kpi_cache.backend.delete_prefix(f"kpis:{link_id}:"))
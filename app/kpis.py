@@ -0,0 +1,139 @@
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Índices de los buckets (tipo, estado). Los OUTFLOW se acumulan en valor absoluto.
+INFLOW_PROCESSED, INFLOW_PENDING, OUTFLOW_PROCESSED, OUTFLOW_PENDING = range(4)
+N_BUCKETS = 4
+
+BUCKET_INDEX: Dict[Tuple[str, str], int] = {
+    ("INFLOW", "PROCESSED"): INFLOW_PROCESSED,
+    ("INFLOW", "PENDING"): INFLOW_PENDING,
+    ("OUTFLOW", "PROCESSED"): OUTFLOW_PROCESSED,
+    ("OUTFLOW", "PENDING"): OUTFLOW_PENDING,
+}
+
+
+def kpis_from_buckets(buckets: Sequence[float], account: Dict[str, Any]) -> Dict[str, Any]:
+    category = account.get("category")
+    account_currency = account.get("currency")
+
+    balance = 0
+    ingresos = egresos = ingresos_pendientes = egresos_pendientes = 0
+    aportes_netos = ganancia_neta = rentabilidad = 0
+
+    if category == "PENSION_FUND_ACCOUNT":
+        funds_data = account.get("funds_data", [])
+        balance = sum(fd.get("balance", 0) for fd in funds_data)
+
+        aportes_netos = buckets[INFLOW_PROCESSED] - buckets[OUTFLOW_PROCESSED]
+        ganancia_neta = balance - aportes_netos
+        rentabilidad = (ganancia_neta / aportes_netos * 100) if aportes_netos > 0 else 0
+
+    else:
+        ingresos = buckets[INFLOW_PROCESSED]
+        egresos = buckets[OUTFLOW_PROCESSED]
+        ingresos_pendientes = buckets[INFLOW_PENDING]
+        egresos_pendientes = buckets[OUTFLOW_PENDING]
+        if category in ("CREDIT_CARD", "LOAN_ACCOUNT"):
+            balance = (account.get("balance") or {}).get("current", 0)
+        else:
+            balance = (account.get("balance") or {}).get("current", ingresos - egresos)
+
+    return {
+        "balance": balance,
+        "ingresos": ingresos,
+        "ingresos_pendientes": ingresos_pendientes,
+        "egresos": egresos,
+        "egresos_pendientes": egresos_pendientes,
+        "account_currency": account_currency,
+        "account_category": category,
+        "aportes_netos": aportes_netos,
+        "ganancia_neta": ganancia_neta,
+        "rentabilidad": rentabilidad,
+    }
+
+
+def empty_kpis(account: Dict[str, Any]) -> Dict[str, Any]:
+    """KPIs de una cuenta sin transacciones, a partir del detalle de la cuenta."""
+    balance = account.get("balance", 0)["current"]
+    category = account.get("category")
+
+    if category == "PENSION_FUND_ACCOUNT":
+        funds_data = account.get("funds_data", [])
+        balance = sum(fd.get("balance", 0) for fd in funds_data)
+    return {
+        "balance": balance,
+        "ingresos": 0,
+        "ingresos_pendientes": 0,
+        "egresos": 0,
+        "egresos_pendientes": 0,
+        "aportes_netos": 0,
+        "ganancia_neta": 0,
+        "rentabilidad": 0,
+        "account_currency": account.get("currency"),
+        "account_category": category,
+    }
+
+
+# Duración mínima en días de cada intervalo, para acotar cuántos periodos abarca un rango.
+PERIOD_DAYS = {"day": 1, "week": 7, "month": 28}
+
+
+def period_start(day: date, interval: str) -> date:
+    """Inicio del periodo que contiene `day`; las semanas empiezan en lunes (ISO)."""
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start: date, interval: str) -> date:
+    if interval == "week":
+        return start + timedelta(days=7)
+    if interval == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+
+def series_from_daily(
+    rows: Iterable[Tuple[date, float, float, float, float, int]],
+    interval: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> List[Dict[str, Any]]:
+    """Agrupa totales diarios ordenados por día en periodos, en una sola pasada.
+
+    Los periodos sin movimientos entre el primero y el último (o `start`/`end`
+    si se indican) aparecen en cero para que las gráficas no tengan huecos.
+    """
+    totals: Dict[date, List[float]] = {}
+    for day, inflow, inflow_pending, outflow, outflow_pending, count in rows:
+        bucket = totals.setdefault(period_start(day, interval), [0.0, 0.0, 0.0, 0.0, 0])
+        bucket[0] += inflow
+        bucket[1] += inflow_pending
+        bucket[2] += outflow
+        bucket[3] += outflow_pending
+        bucket[4] += count
+    if not totals and (start is None or end is None):
+        return []
+
+    period = period_start(start or min(totals), interval)
+    last = period_start(end or max(totals), interval)
+    series = []
+    while period <= last:
+        inflow, inflow_pending, outflow, outflow_pending, count = totals.get(period, (0.0, 0.0, 0.0, 0.0, 0))
+        series.append({
+            "period": period.isoformat(),
+            "ingresos": inflow,
+            "ingresos_pendientes": inflow_pending,
+            "egresos": outflow,
+            "egresos_pendientes": outflow_pending,
+            "neto": inflow - outflow,
+            "transacciones": count,
+        })
+        if period == last:
+            # next_period no existe después de diciembre del año 9999.
+            break
+        period = next_period(period, interval)
+    return series
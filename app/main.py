@@ -1,14 +1,49 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import List, Literal, Optional
+import orjson
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
-from app import models, schemas, crud, belvo_client, auth
-from app.database import engine, get_db
+from app import schemas, crud, belvo_client, belvo_http, auth, dashboard, health, institution_cache, invalidation, metrics, onboarding, scheduler, transaction_store, webhooks
+from app.database import dispose_async_engine, engine, get_async_db, get_async_engine, get_db
 from app.config import settings
-from fastapi.responses import JSONResponse
+from app.compression import CompressionMiddleware
+from app.fields import FieldSelection
+from app.kpi_cache import kpi_cache
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 
-models.Base.metadata.create_all(bind=engine)
+# El esquema se crea y actualiza con Alembic (`alembic upgrade head`), no al importar la app.
 
-app = FastAPI(title="PWA Belvo Integration API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.instrument_engine(get_async_engine().sync_engine)
+    await belvo_http.startup()
+    invalidation.start()
+    if settings.SCHEDULER_ENABLED:
+        scheduler.scheduler.start()
+    onboarding.resume_jobs()
+    webhooks.processor.start()
+    await health.warm_up()
+    health.state.ready = True
+    try:
+        yield
+    finally:
+        health.state.draining = True
+        await webhooks.processor.stop(drain_timeout=settings.SHUTDOWN_DRAIN_SECONDS)
+        await onboarding.cancel_all()
+        await scheduler.scheduler.stop()
+        await belvo_http.shutdown()
+        await invalidation.stop()
+        await dispose_async_engine()
+        auth.shutdown_hashing()
+
+app = FastAPI(title="PWA Belvo Integration API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+metrics.instrument_engine(engine)
+app.middleware("http")(metrics.metrics_middleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,37 +52,193 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+)
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return metrics.metrics_response()
+
+@app.get("/healthz", include_in_schema=False)
+def liveness():
+    # Sólo indica que el proceso responde; no consulta dependencias.
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readiness():
+    ok, checks = await health.readiness()
+    return ORJSONResponse({"status": "ok" if ok else "unavailable", "checks": checks}, status_code=200 if ok else 503)
 
 @app.post("/register", response_model=schemas.UserOut)
-def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = crud.get_user_by_username(db, user_in.username)
+async def register(user_in: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing = await crud.get_user_by_username_async(db, user_in.username)
     if existing:
         raise HTTPException(status_code=400, detail="Username already registered")
-    user = crud.create_user(db, user_in.username, user_in.password)
+    user = await crud.create_user(db, user_in.username, user_in.password)
     return user
 
 @app.post("/login", response_model=schemas.Token)
-def login(form_data: schemas.UserCreate, db: Session = Depends(get_db)):
-    user = crud.authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    user = await crud.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
-    access_token = auth.create_access_token({"sub": user.username})
+    access_token = auth.create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Comparación débil de If-None-Match: lista separada por comas o `*`."""
+    # La compresión vuelve débil el ETag (W/"..."); se comparan sin el prefijo.
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
 @app.get("/banks")
-def list_banks(page: int = 1, db: Session = Depends(get_db), current_user = Depends(auth.get_current_user)):
-    data = belvo_client.list_institutions(page=page, db=db)
-    return data
+async def list_banks(request: Request, page: int = 1, fields: Optional[str] = None, exclude: Optional[str] = None, current_user = Depends(auth.get_current_user)):
+    entry = await institution_cache.catalog.get_page(page=page)
+    body, etag = entry.render(FieldSelection.parse(fields, exclude))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.post("/banks/sync")
+async def sync_banks(db: Session = Depends(get_db), current_user = Depends(auth.get_current_user)):
+    result = await belvo_client.sync_institutions(db)
+    institution_cache.catalog.clear()
+    await invalidation.broadcast("catalog")
+    return result
 
 @app.get("/bank/{bank_id}/accounts")
-def bank_accounts(bank_id: str, current_user = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    data = belvo_client.get_accounts_for_institution(bank_id, db)
+async def bank_accounts(bank_id: str, current_user = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    data = await belvo_client.get_accounts_for_institution(bank_id, db, current_user.id)
     return data
 
 @app.get("/account/{account_id}/kpis/{bank_name}")
-def account_kpis(account_id: str, bank_name: str, current_user=Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    link_id = belvo_client.get_link_by_bank(bank_name, db)
-    return belvo_client.get_account_kpis(account_id, link_id)
+async def account_kpis(account_id: str, bank_name: str, include_transactions: bool = False, fields: Optional[str] = None, exclude: Optional[str] = None, current_user=Depends(auth.get_current_user), db: Session = Depends(get_db), adb: AsyncSession = Depends(get_async_db)):
+    link_id = await belvo_client.get_link_by_bank_async(bank_name, adb, current_user.id)
+    selection = FieldSelection.parse(fields, exclude)
+    if include_transactions and selection.includes("transactions"):
+        account = await transaction_store.ensure_synced(account_id, link_id, db)
+        body = await transaction_store.stream_account_kpis(account, db, selection=selection)
+        return StreamingResponse(body, media_type="application/json")
+
+    async def compute():
+        return await transaction_store.synced_kpis(account_id, link_id)
+
+    return selection.apply(await kpi_cache.get_or_compute(account_id, link_id, compute))
+
+
+@app.get("/account/{account_id}/kpis/{bank_name}/series")
+async def account_kpi_series(
+    account_id: str,
+    bank_name: str,
+    interval: Literal["day", "week", "month"] = "day",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    current_user=Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+    adb: AsyncSession = Depends(get_async_db),
+):
+    link_id = await belvo_client.get_link_by_bank_async(bank_name, adb, current_user.id)
+    account = await transaction_store.ensure_synced(account_id, link_id, db)
+    return await asyncio.to_thread(transaction_store.kpi_series, account, db, interval, date_from, date_to)
+
+
+def _csv(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+@app.get("/account/{account_id}/transactions/{bank_name}")
+async def account_transactions(
+    account_id: str,
+    bank_name: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    tx_type: Optional[str] = Query(None, alias="type"),
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    sort: str = "-value_date",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    fields: Optional[str] = None,
+    exclude: Optional[str] = None,
+    current_user=Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+    adb: AsyncSession = Depends(get_async_db),
+):
+    link_id = await belvo_client.get_link_by_bank_async(bank_name, adb, current_user.id)
+    account = await transaction_store.ensure_synced(account_id, link_id, db)
+    page = await asyncio.to_thread(
+        transaction_store.list_transactions,
+        db,
+        account_id,
+        date_from=date_from,
+        date_to=date_to,
+        types=_csv(tx_type),
+        statuses=_csv(status),
+        categories=_csv(category),
+        sort=sort,
+        cursor=cursor,
+        limit=limit,
+    )
+    selection = FieldSelection.parse(fields, exclude)
+    page["results"] = [selection.apply(tx) for tx in page["results"]]
+    return page
+
+
+@app.post("/account/{account_id}/sync/{bank_name}")
+async def account_sync(account_id: str, bank_name: str, current_user=Depends(auth.get_current_user), db: Session = Depends(get_db), adb: AsyncSession = Depends(get_async_db)):
+    link_id = await belvo_client.get_link_by_bank_async(bank_name, adb, current_user.id)
+    result = await transaction_store.sync_account_transactions(account_id, link_id, db)
+    await kpi_cache.invalidate_account(account_id, link_id)
+    return result
+
+
+@app.post("/onboarding/jobs", status_code=202)
+async def create_onboarding_job(job_in: schemas.OnboardingJobCreate, current_user=Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    def create():
+        job = onboarding.create_job(db, current_user.id, job_in.institutions)
+        return onboarding.job_snapshot(db, job)
+
+    snapshot = await asyncio.to_thread(create)
+    onboarding.start(snapshot["id"])
+    return snapshot
+
+
+@app.get("/onboarding/jobs/{job_id}")
+def onboarding_job(job_id: str, current_user=Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    return onboarding.job_snapshot(db, onboarding.get_job(db, job_id, current_user.id))
+
+
+@app.get("/onboarding/jobs/{job_id}/events")
+async def onboarding_job_events(job_id: str, current_user=Depends(auth.get_current_user)):
+    await asyncio.to_thread(onboarding.check_access, job_id, current_user.id)
+    return StreamingResponse(
+        onboarding.job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/webhooks/belvo", status_code=202, include_in_schema=False)
+async def belvo_webhook(request: Request):
+    webhooks.verify_authorization(request.headers.get("authorization"))
+    try:
+        event = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Cuerpo JSON inválido")
+    if not isinstance(event, dict):
+        raise HTTPException(status_code=400, detail="Se esperaba un objeto JSON")
+    return {"queued": webhooks.processor.enqueue(event)}
+
+
+@app.get("/dashboard")
+async def dashboard_view(bank: Optional[str] = None, current_user=Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    banks = [bank] if bank else await asyncio.to_thread(dashboard.linked_banks, db, current_user.id)
+    return await dashboard.build_dashboard(banks, current_user.id)
 
 
 @app.post("/logout")
@@ -0,0 +1,124 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latencia de las rutas de la API", ["method", "route", "status"]
+)
+STAGE_LATENCY = Histogram(
+    "http_request_stage_duration_seconds", "Tiempo por etapa dentro de una petición", ["route", "stage"]
+)
+UPSTREAM_LATENCY = Histogram(
+    "belvo_request_duration_seconds", "Latencia de cada intento de llamada a Belvo", ["endpoint", "method", "status"]
+)
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Duración de las sentencias SQL", ["operation"])
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Espera para obtener una conexión del pool",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+CACHE_REQUESTS = Counter("cache_requests_total", "Consultas a cachés en memoria", ["cache", "result"])
+WEBHOOK_EVENTS = Counter("belvo_webhook_events_total", "Webhooks de Belvo recibidos", ["type", "result"])
+SCHEDULER_REFRESHES = Counter("scheduler_link_refreshes_total", "Links refrescados en segundo plano", ["result"])
+
+# Tiempos por etapa de la petición en curso; el middleware crea un dict nuevo por petición.
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+_db_queries: ContextVar[Optional[list]] = ContextVar("request_db_queries", default=None)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    stages = _stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_cache(cache: str, result: str) -> None:
+    CACHE_REQUESTS.labels(cache=cache, result=result).inc()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Cuenta y mide las sentencias SQL y la espera de checkout del pool."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = statement.lstrip().split(" ", 1)[0].upper() or "OTHER"
+        DB_QUERY_LATENCY.labels(operation=operation).observe(elapsed)
+        record_stage("db", elapsed)
+        queries = _db_queries.get()
+        if queries is not None:
+            queries[0] += 1
+
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            elapsed = time.perf_counter() - start
+            DB_POOL_WAIT.observe(elapsed)
+            record_stage("db_pool", elapsed)
+
+    pool.connect = timed_connect
+
+
+def _server_timing(stages: Dict[str, float], total: float, queries: int) -> str:
+    parts = [f"{name};dur={seconds * 1e3:.2f}" for name, seconds in stages.items()]
+    if queries:
+        parts.append(f'db_queries;desc="{queries}"')
+    parts.append(f"total;dur={total * 1e3:.2f}")
+    return ", ".join(parts)
+
+
+async def metrics_middleware(request: Request, call_next):
+    stages: Dict[str, float] = {}
+    queries = [0]
+    stages_token = _stages.set(stages)
+    queries_token = _db_queries.set(queries)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        total = time.perf_counter() - start
+        _stages.reset(stages_token)
+        _db_queries.reset(queries_token)
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        REQUEST_LATENCY.labels(method=request.method, route=route_path, status=str(status)).observe(total)
+        for name, seconds in stages.items():
+            STAGE_LATENCY.labels(route=route_path, stage=name).observe(seconds)
+    response.headers["Server-Timing"] = _server_timing(stages, total, queries[0])
+    return response
+
+
+def metrics_response() -> Response:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Varios workers: se suman las métricas de todos los procesos.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
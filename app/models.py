@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Date, Float, ForeignKey, Index, UniqueConstraint, func, JSON
 from sqlalchemy.sql import text
 from app.database import Base
 from sqlalchemy.dialects.postgresql import JSONB
@@ -13,11 +13,19 @@ class User(Base):
 
 class Link(Base):
     __tablename__ = "links"
+    __table_args__ = (
+        UniqueConstraint("user_id", "institution", name="uq_links_user_institution"),
+    )
 
     id = Column(String, primary_key=True, index=True)
-    institution = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    institution = Column(String, nullable=False, index=True)
     access_mode = Column(String)
     last_accessed_at = Column(String)
+    # Último uso por parte del usuario; el scheduler sólo refresca links en uso.
+    last_used_at = Column(DateTime(timezone=True), nullable=True)
+    # Próximo refresco en segundo plano; nulo si nunca se ha refrescado.
+    next_refresh_at = Column(DateTime(timezone=True), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     external_id = Column(String)
     institution_user_id = Column(String)
@@ -35,7 +43,7 @@ class Institution(Base):
 
     id = Column(String, primary_key=True, index=True)   
     code = Column(String, nullable=True)
-    name = Column(String, nullable=False)
+    name = Column(String, nullable=False, index=True)
     display_name = Column(String, nullable=True)
     type = Column(String, nullable=True)
     country_code = Column(String, nullable=True)
@@ -50,4 +58,93 @@ class Institution(Base):
     integration_type = Column(String, nullable=True)
     status = Column(String, nullable=True)
     resources = Column(JSONB, nullable=True)   
-    openbanking_information = Column(JSONB, nullable=True)  
\ No newline at end of file
+    openbanking_information = Column(JSONB, nullable=True)
+    # Hash del contenido sincronizado desde Belvo; si no cambia no se reescribe la fila.
+    content_hash = Column(String(64), nullable=True)
+
+
+class Account(Base):
+    __tablename__ = "accounts"
+
+    id = Column(String, primary_key=True, index=True)
+    link_id = Column(String, index=True, nullable=False)
+    institution = Column(String, nullable=True)
+    name = Column(String, nullable=True)
+    type = Column(String, nullable=True)
+    category = Column(String, nullable=True)
+    currency = Column(String, nullable=True)
+    balance_current = Column(Float, nullable=True)
+    raw = Column(JSONB, nullable=True)
+    # Mayor value_date sincronizado: la siguiente sincronización parte de aquí.
+    transactions_synced_until = Column(Date, nullable=True)
+    last_synced_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class Transaction(Base):
+    __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_account_type_status", "account_id", "type", "status"),
+    )
+
+    id = Column(String, primary_key=True)
+    account_id = Column(String, nullable=False)
+    link_id = Column(String, nullable=False)
+    value_date = Column(Date, nullable=True)
+    amount = Column(Float, nullable=False)
+    currency = Column(String, nullable=True)
+    type = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    category = Column(String, nullable=True)
+    description = Column(String, nullable=True)
+    raw = Column(JSONB, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+# Índices de la paginación keyset de transaction_store.list_transactions: (cuenta, orden, id),
+# con las fechas nulas primero igual que el ORDER BY.
+Index(
+    "ix_transactions_account_value_date_id",
+    Transaction.account_id, Transaction.value_date.asc().nulls_first(), Transaction.id,
+)
+Index("ix_transactions_account_amount_id", Transaction.account_id, Transaction.amount, Transaction.id)
+
+
+class TransactionRollup(Base):
+    """Totales diarios por cuenta, mantenidos en cada sincronización para las series de KPIs."""
+    __tablename__ = "transaction_daily_rollups"
+
+    account_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    inflow_processed = Column(Float, nullable=False, default=0)
+    inflow_pending = Column(Float, nullable=False, default=0)
+    outflow_processed = Column(Float, nullable=False, default=0)
+    outflow_pending = Column(Float, nullable=False, default=0)
+    transactions = Column(Integer, nullable=False, default=0)
+
+
+class OnboardingJob(Base):
+    __tablename__ = "onboarding_jobs"
+
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="pending")
+    total = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class OnboardingItem(Base):
+    __tablename__ = "onboarding_items"
+    __table_args__ = (
+        UniqueConstraint("job_id", "institution", name="uq_onboarding_items_job_institution"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String, ForeignKey("onboarding_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    institution = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    link_id = Column(String, nullable=True)
+    error = Column(JSON, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app import belvo_client, models
+from app.config import settings
+from app.dashboard import error_payload
+from app.database import SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("completed", "partial", "failed")
+
+# Trabajos en ejecución en este proceso y su señal de progreso para el SSE.
+_running: Dict[str, asyncio.Task] = {}
+_progress: Dict[str, asyncio.Event] = {}
+
+
+def create_job(db: Session, user_id: int, institutions: List[str]) -> models.OnboardingJob:
+    institutions = list(dict.fromkeys(i.strip() for i in institutions if i.strip()))
+    if not institutions:
+        raise HTTPException(status_code=400, detail="Indica al menos una institución")
+    if len(institutions) > settings.ONBOARDING_MAX_INSTITUTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A lo sumo {settings.ONBOARDING_MAX_INSTITUTIONS} instituciones por trabajo",
+        )
+    job = models.OnboardingJob(
+        id=str(uuid.uuid4()), user_id=user_id, status="pending", total=len(institutions), succeeded=0, failed=0
+    )
+    db.add(job)
+    db.add_all(models.OnboardingItem(job_id=job.id, institution=i, status="pending") for i in institutions)
+    db.commit()
+    return job
+
+
+def get_job(db: Session, job_id: str, user_id: int) -> models.OnboardingJob:
+    job = db.get(models.OnboardingJob, job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+def job_snapshot(db: Session, job: models.OnboardingJob) -> Dict[str, Any]:
+    items = (
+        db.query(models.OnboardingItem)
+        .filter(models.OnboardingItem.job_id == job.id)
+        .order_by(models.OnboardingItem.id)
+        .all()
+    )
+    return {
+        "id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "succeeded": job.succeeded,
+        "failed": job.failed,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "items": [
+            {"institution": i.institution, "status": i.status, "link_id": i.link_id, "error": i.error}
+            for i in items
+        ],
+    }
+
+
+def start(job_id: str) -> None:
+    if job_id in _running:
+        return
+    task = asyncio.ensure_future(run_job(job_id))
+    _running[job_id] = task
+    task.add_done_callback(lambda _: _running.pop(job_id, None))
+
+
+def _job_lock_key(job_id: str) -> int:
+    return int.from_bytes(hashlib.sha1(f"onboarding:{job_id}".encode()).digest()[:8], "big", signed=True)
+
+
+def _lock_job(job_id: str) -> Optional[Connection]:
+    """Toma el advisory lock del trabajo para que un solo worker lo ejecute.
+
+    Devuelve la conexión que lo retiene (None si otro proceso ya lo tiene).
+    Fuera de Postgres no hay varios workers que coordinar.
+    """
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    if engine.dialect.name != "postgresql":
+        return conn
+    if conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _job_lock_key(job_id)}).scalar():
+        return conn
+    conn.close()
+    return None
+
+
+def _notify(job_id: str) -> None:
+    event = _progress.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+
+async def run_job(job_id: str) -> None:
+    """Crea los links pendientes del trabajo con a lo sumo ONBOARDING_CONCURRENCY a la vez.
+
+    Cada institución pasa por register_link_institution, que es idempotente,
+    así que reanudar un trabajo interrumpido no duplica links. Las escrituras
+    en la base de datos corren en hilos y ninguna sesión queda abierta
+    mientras se espera a Belvo.
+    """
+    lock = await asyncio.to_thread(_lock_job, job_id)
+    if lock is None:
+        logger.info("El trabajo %s ya se ejecuta en otro proceso", job_id)
+        return
+    try:
+        await _run_job(job_id)
+    finally:
+        # Cerrar la conexión libera el lock de sesión.
+        await asyncio.to_thread(lock.close)
+
+
+async def _run_job(job_id: str) -> None:
+    started = await asyncio.to_thread(_start_job, job_id)
+    if started is None:
+        return
+    user_id, pending = started
+    _notify(job_id)
+
+    semaphore = asyncio.Semaphore(settings.ONBOARDING_CONCURRENCY)
+
+    async def onboard(institution: str) -> None:
+        async with semaphore:
+            try:
+                await asyncio.to_thread(_set_item, job_id, institution, status="running")
+                _notify(job_id)
+                link = await _register(institution, user_id)
+            except Exception as exc:
+                outcome = {"ok": False, "error": error_payload(exc)}
+            else:
+                outcome = {"ok": True, "link_id": link.get("id")}
+            try:
+                await asyncio.to_thread(_finish_item, job_id, institution, **outcome)
+            except Exception:
+                # El ítem queda "running" y se reintenta al reanudar el trabajo.
+                logger.exception("No se pudo guardar el resultado de %s en el trabajo %s", institution, job_id)
+            _notify(job_id)
+
+    try:
+        await asyncio.gather(*(onboard(i) for i in pending))
+    finally:
+        await asyncio.to_thread(_close_job, job_id)
+        _notify(job_id)
+
+
+async def _register(institution: str, user_id: int) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        return await belvo_client.register_link_institution(institution, db, user_id)
+    finally:
+        await asyncio.to_thread(db.close)
+
+
+def _start_job(job_id: str) -> Optional[Tuple[int, List[str]]]:
+    with SessionLocal() as db:
+        job = db.get(models.OnboardingJob, job_id)
+        if job is None or job.status in FINISHED:
+            return None
+        user_id = job.user_id
+        pending = [
+            institution
+            for (institution,) in db.query(models.OnboardingItem.institution).filter(
+                models.OnboardingItem.job_id == job_id, models.OnboardingItem.status.in_(("pending", "running"))
+            )
+        ]
+        job.status = "running"
+        db.commit()
+    return user_id, pending
+
+
+def _close_job(job_id: str) -> None:
+    with SessionLocal() as db:
+        job = db.get(models.OnboardingJob, job_id)
+        if job.succeeded + job.failed >= job.total:
+            job.status = "completed" if not job.failed else ("failed" if not job.succeeded else "partial")
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+
+
+def _set_item(job_id: str, institution: str, **values: Any) -> None:
+    with SessionLocal() as db:
+        db.execute(
+            update(models.OnboardingItem)
+            .where(models.OnboardingItem.job_id == job_id, models.OnboardingItem.institution == institution)
+            .values(**values)
+        )
+        db.commit()
+
+
+def _finish_item(job_id: str, institution: str, ok: bool, link_id: Optional[str] = None, error: Any = None) -> None:
+    with SessionLocal() as db:
+        db.execute(
+            update(models.OnboardingItem)
+            .where(models.OnboardingItem.job_id == job_id, models.OnboardingItem.institution == institution)
+            .values(status="done" if ok else "error", link_id=link_id, error=error)
+        )
+        counter = models.OnboardingJob.succeeded if ok else models.OnboardingJob.failed
+        db.execute(
+            update(models.OnboardingJob)
+            .where(models.OnboardingJob.id == job_id)
+            .values({counter: counter + 1})
+        )
+        db.commit()
+
+
+def resume_jobs() -> int:
+    """Reanuda los trabajos que quedaron a medias al reiniciar el proceso."""
+    with SessionLocal() as db:
+        job_ids = [
+            job_id
+            for (job_id,) in db.query(models.OnboardingJob.id).filter(
+                models.OnboardingJob.status.in_(("pending", "running"))
+            )
+        ]
+    for job_id in job_ids:
+        start(job_id)
+    return len(job_ids)
+
+
+async def cancel_all() -> None:
+    tasks = list(_running.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def check_access(job_id: str, user_id: int) -> None:
+    with SessionLocal() as db:
+        get_job(db, job_id, user_id)
+
+
+def _load_snapshot(job_id: str) -> Dict[str, Any]:
+    with SessionLocal() as db:
+        return job_snapshot(db, db.get(models.OnboardingJob, job_id))
+
+
+def _sse(event: str, data: Dict[str, Any]) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+async def job_events(job_id: str) -> AsyncIterator[bytes]:
+    """Eventos SSE con el estado del trabajo cada vez que cambia.
+
+    En el proceso que ejecuta el trabajo se despierta con cada avance; si el
+    trabajo corre en otra instancia se consulta cada ONBOARDING_SSE_POLL_SECONDS.
+    """
+    last = None
+    while True:
+        event = _progress.setdefault(job_id, asyncio.Event())
+        snapshot = await asyncio.to_thread(_load_snapshot, job_id)
+        if snapshot != last:
+            last = snapshot
+            yield _sse("progress", snapshot)
+        if snapshot["status"] in FINISHED:
+            _notify(job_id)
+            yield _sse("done", {"id": job_id, "status": snapshot["status"]})
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout=settings.ONBOARDING_SSE_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import logging
+import random
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import or_, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app import belvo_client, belvo_http, metrics, models, transaction_store
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.resilience import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock de sesión que identifica a la instancia líder.
+LEADER_LOCK_KEY = int.from_bytes(hashlib.sha1(b"scheduler:refresh").digest()[:8], "big", signed=True)
+
+_DURATION = re.compile(r"^\s*(\d+)\s*([smhd])\s*$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value: Optional[str]) -> Optional[timedelta]:
+    """Convierte los periodos de Belvo ("24h", "7d", "365d") a timedelta."""
+    match = _DURATION.match(value or "")
+    if not match:
+        return None
+    return timedelta(seconds=int(match.group(1)) * _UNITS[match.group(2)])
+
+
+def refresh_interval(link: models.Link) -> timedelta:
+    """Cada cuánto refrescar un link, adelantado por SCHEDULER_REFRESH_AHEAD_RATIO.
+
+    Se toma su `refresh_rate`, que es cada cuánto Belvo trae datos nuevos del
+    banco; sin él, SCHEDULER_DEFAULT_REFRESH_SECONDS.
+    """
+    interval = parse_duration(link.refresh_rate) or timedelta(seconds=settings.SCHEDULER_DEFAULT_REFRESH_SECONDS)
+    return interval * settings.SCHEDULER_REFRESH_AHEAD_RATIO
+
+
+def due_links(db: Session, now: datetime, limit: int) -> List[str]:
+    """Links en uso cuyo próximo refresco ya venció, los más atrasados primero.
+
+    En uso: válidos, con dueño y consultados por él (Link.last_used_at, que
+    anotan las rutas) en los últimos SCHEDULER_IDLE_LINK_SECONDS.
+    """
+    L = models.Link
+    rows = (
+        db.query(L.id)
+        .filter(
+            L.status == "valid",
+            L.user_id.isnot(None),
+            L.last_used_at >= now - timedelta(seconds=settings.SCHEDULER_IDLE_LINK_SECONDS),
+            or_(L.next_refresh_at.is_(None), L.next_refresh_at <= now),
+        )
+        .order_by(L.next_refresh_at.asc().nulls_first())
+        .limit(limit)
+        .all()
+    )
+    return [link_id for (link_id,) in rows]
+
+
+def schedule_next_refresh(link_id: str, now: datetime, ok: bool) -> None:
+    """Programa el siguiente refresco; tras un fallo se reintenta en SCHEDULER_RETRY_SECONDS."""
+    with SessionLocal() as db:
+        link = db.get(models.Link, link_id)
+        if link is None:
+            return
+        delay = refresh_interval(link) if ok else timedelta(seconds=settings.SCHEDULER_RETRY_SECONDS)
+        link.next_refresh_at = now + delay
+        db.commit()
+
+
+def _due_link_ids() -> List[str]:
+    with SessionLocal() as db:
+        return due_links(db, datetime.now(timezone.utc), settings.SCHEDULER_MAX_LINKS_PER_TICK)
+
+
+class RefreshScheduler:
+    """Refresca en segundo plano cuentas, transacciones y KPIs de los links activos.
+
+    Con varias instancias sólo trabaja la que obtiene el advisory lock de
+    Postgres; las demás lo reintentan en cada vuelta. Los refrescos se reparten
+    con jitter y pasan por el mismo limitador y circuit breaker que las rutas.
+    """
+
+    def __init__(self, interval: float, jitter: float, concurrency: int, breaker: CircuitBreaker):
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.breaker = breaker
+        self._task: Optional[asyncio.Task] = None
+        self._leader_conn: Optional[Connection] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self._release_leadership)
+
+    def is_leader(self) -> bool:
+        if not settings.SCHEDULER_LEADER_ELECTION or engine.dialect.name != "postgresql":
+            return True
+        if self._leader_conn is not None:
+            try:
+                self._leader_conn.execute(text("SELECT 1"))
+                return True
+            except DBAPIError:
+                # Si la conexión se cayó, el lock se perdió con ella.
+                logger.warning("Conexión de liderazgo perdida, se vuelve a competir por el lock")
+                self._release_leadership()
+        conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": LEADER_LOCK_KEY}).scalar()
+        if acquired:
+            self._leader_conn = conn
+            logger.info("Esta instancia es líder del refresco en segundo plano")
+        else:
+            conn.close()
+        return bool(acquired)
+
+    def _release_leadership(self) -> None:
+        if self._leader_conn is None:
+            return
+        try:
+            self._leader_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LEADER_LOCK_KEY})
+        except DBAPIError:
+            pass
+        finally:
+            self._leader_conn.close()
+            self._leader_conn = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await asyncio.to_thread(self.is_leader):
+                    await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en el ciclo de refresco en segundo plano")
+            await asyncio.sleep(self.interval * random.uniform(0.9, 1.1))
+
+    async def tick(self) -> int:
+        """Refresca los links vencidos; devuelve cuántos se intentaron."""
+        if self.breaker.state == CircuitBreaker.OPEN:
+            return 0
+        link_ids = await asyncio.to_thread(_due_link_ids)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._refresh_link(link_id, semaphore) for link_id in link_ids))
+        return len(link_ids)
+
+    async def _refresh_link(self, link_id: str, semaphore: asyncio.Semaphore) -> None:
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        async with semaphore:
+            ok = True
+            try:
+                for account in await belvo_client.list_link_accounts(link_id):
+                    await transaction_store.refresh_account(account["id"], link_id, account)
+            except Exception as exc:
+                ok = False
+                logger.warning("No se pudo refrescar el link %s: %s", link_id, exc)
+            await asyncio.to_thread(schedule_next_refresh, link_id, datetime.now(timezone.utc), ok)
+        metrics.SCHEDULER_REFRESHES.labels(result="ok" if ok else "error").inc()
+
+
+scheduler = RefreshScheduler(
+    interval=settings.SCHEDULER_INTERVAL_SECONDS,
+    jitter=settings.SCHEDULER_JITTER_SECONDS,
+    concurrency=settings.SCHEDULER_CONCURRENCY,
+    breaker=belvo_http.breaker,
+)
@@ -1,3 +1,4 @@
+from typing import List
 from pydantic import BaseModel
 
 class UserCreate(BaseModel):
@@ -13,3 +14,6 @@ class UserOut(BaseModel):
     username: str
     class Config:
         orm_mode = True
+
+class OnboardingJobCreate(BaseModel):
+    institutions: List[str]
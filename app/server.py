@@ -0,0 +1,111 @@
+"""Arranque de producción: `python -m app.server`.
+
+Levanta uvicorn con un worker por núcleo disponible (hasta WEB_MAX_WORKERS,
+o WEB_CONCURRENCY si se fija), uvloop y httptools, y un apagado ordenado:
+al recibir SIGTERM /readyz responde 503 durante SHUTDOWN_READINESS_DELAY_SECONDS
+mientras se siguen atendiendo peticiones, luego se deja terminar las que
+están en curso durante GRACEFUL_SHUTDOWN_SECONDS y por último se vacía la cola
+de webhooks durante SHUTDOWN_DRAIN_SECONDS. La suma debe quedar por debajo
+del kill_timeout de fly.toml.
+
+Los pools de base de datos y el límite de peticiones a Belvo se configuran
+por instancia y cada worker toma su parte (config.per_worker). Las cachés
+en memoria son de cada worker; sus invalidaciones llegan a los demás por
+LISTEN/NOTIFY de Postgres (app.invalidation).
+"""
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import tempfile
+from types import FrameType
+from typing import Optional
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from app.config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class DrainingServer(uvicorn.Server):
+    """Server de uvicorn que deja de estar listo antes de dejar de aceptar conexiones."""
+
+    def __init__(self, config: uvicorn.Config):
+        super().__init__(config)
+        self._draining = False
+
+    def handle_exit(self, sig: int, frame: Optional[FrameType]) -> None:
+        delay = settings.SHUTDOWN_READINESS_DELAY_SECONDS
+        if sig != signal.SIGTERM or self._draining or delay <= 0:
+            super().handle_exit(sig, frame)
+            return
+        self._draining = True
+        # El worker ya importó la app; aquí sólo se marca el estado para /readyz.
+        from app import health
+
+        health.state.draining = True
+        asyncio.get_event_loop().call_later(delay, super().handle_exit, sig, frame)
+
+
+class ParallelMultiprocess(Multiprocess):
+    """Avisa a todos los workers a la vez; uvicorn espera a que termine cada uno antes del siguiente."""
+
+    def shutdown(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info("Stopping parent process [%d]", self.pid)
+
+
+def worker_count() -> int:
+    if settings.WEB_CONCURRENCY:
+        return settings.WEB_CONCURRENCY
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # sched_getaffinity no existe en macOS
+        cores = os.cpu_count() or 1
+    return max(1, min(cores, settings.WEB_MAX_WORKERS))
+
+
+def _prepare_metrics_dir() -> None:
+    # Con varios workers cada proceso escribe sus métricas aquí y /metrics las suma.
+    path = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus-multiproc")
+    )
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def main() -> None:
+    workers = worker_count()
+    # Los workers leen el total para repartirse pools y límites.
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    if workers > 1:
+        _prepare_metrics_dir()
+    config = uvicorn.Config(
+        "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        timeout_keep_alive=settings.KEEPALIVE_TIMEOUT_SECONDS,
+        timeout_graceful_shutdown=settings.GRACEFUL_SHUTDOWN_SECONDS,
+        access_log=settings.ACCESS_LOG,
+    )
+    server = DrainingServer(config)
+    if workers > 1:
+        ParallelMultiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+
+if __name__ == "__main__":
+    main()
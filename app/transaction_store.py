@@ -0,0 +1,471 @@
+import asyncio
+import base64
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import and_, case, delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import belvo_client, kpis, models
+from app.config import settings
+from app.database import SessionLocal
+from app.fields import FieldSelection
+from app.kpi_cache import kpi_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+
+
+def _account_row(account: Dict[str, Any], link_id: str) -> Dict[str, Any]:
+    return {
+        "id": account["id"],
+        "link_id": link_id,
+        "institution": (account.get("institution") or {}).get("name"),
+        "name": account.get("name"),
+        "type": account.get("type"),
+        "category": account.get("category"),
+        "currency": account.get("currency"),
+        "balance_current": (account.get("balance") or {}).get("current"),
+        "raw": account,
+    }
+
+
+def _transaction_row(tx: Dict[str, Any], account_id: str, link_id: str) -> Dict[str, Any]:
+    # La cuenta embebida se guarda una sola vez en accounts.raw.
+    raw = {k: v for k, v in tx.items() if k != "account"}
+    return {
+        "id": tx["id"],
+        "account_id": account_id,
+        "link_id": link_id,
+        "value_date": _parse_date(tx.get("value_date")),
+        "amount": tx.get("amount") or 0,
+        "currency": tx.get("currency"),
+        "type": tx.get("type"),
+        "status": tx.get("status"),
+        "category": tx.get("category"),
+        "description": tx.get("description"),
+        "raw": raw,
+    }
+
+
+def _upsert(db: Session, model, rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    stmt = insert(model).values(rows)
+    set_ = {key: stmt.excluded[key] for key in rows[0] if key != "id"}
+    if hasattr(model, "updated_at"):
+        set_["updated_at"] = func.now()
+    db.execute(stmt.on_conflict_do_update(index_elements=[model.id], set_=set_))
+
+
+def _not_found() -> HTTPException:
+    return HTTPException(status_code=404, detail="Cuenta no encontrada para este banco")
+
+
+def _check_link(account: Dict[str, Any], link_id: str) -> None:
+    """La cuenta de Belvo debe ser del link con el que se pide."""
+    link = account.get("link")
+    if isinstance(link, dict):
+        link = link.get("id")
+    if link not in (None, link_id):
+        raise _not_found()
+
+
+async def sync_account_transactions(
+    account_id: str, link_id: str, db: Session, account: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Trae de Belvo sólo las transacciones posteriores a la marca de agua de la cuenta.
+
+    Se vuelve a pedir una ventana de TRANSACTION_SYNC_OVERLAP_DAYS antes de la
+    marca para recoger cambios de estado (PENDING -> PROCESSED) recientes; el
+    upsert por id hace que repetirlas sea inocuo. La sesión es síncrona: cada
+    escritura corre en un hilo para no bloquear el event loop, y cada página
+    se confirma por separado para no retener conexión ni locks mientras se
+    espera a Belvo.
+    """
+    watermark = await asyncio.to_thread(_load_watermark, db, account_id, link_id)
+    filters = {}
+    if watermark:
+        since = watermark - timedelta(days=settings.TRANSACTION_SYNC_OVERLAP_DAYS)
+        filters["value_date__gte"] = since.isoformat()
+
+    upserted = 0
+    async for page in belvo_client.iter_transaction_pages(account_id, link_id, filters):
+        if not page:
+            continue
+        if account is None:
+            account = page[0]["account"]
+            _check_link(account, link_id)
+        rows = [_transaction_row(t, account_id, link_id) for t in page]
+        await asyncio.to_thread(_save_page, db, rows)
+        upserted += len(rows)
+        page_max = max((r["value_date"] for r in rows if r["value_date"]), default=None)
+        if page_max and (watermark is None or page_max > watermark):
+            watermark = page_max
+
+    if account is None:
+        account = await belvo_client.get_account(account_id)
+        _check_link(account, link_id)
+
+    account_row = {
+        **_account_row(account, link_id),
+        "transactions_synced_until": watermark,
+        "last_synced_at": datetime.now(timezone.utc),
+    }
+    since = _parse_date(filters.get("value_date__gte")) if upserted else None
+    await asyncio.to_thread(_finish_sync, db, account_row, upserted > 0, since)
+    return {"account_id": account_id, "transactions_upserted": upserted, "synced_until": watermark}
+
+
+def _load_watermark(db: Session, account_id: str, link_id: str) -> Optional[date]:
+    stored = db.get(models.Account, account_id)
+    if stored is not None and stored.link_id != link_id:
+        # Una cuenta almacenada nunca cambia de link: sería entregarla a otro usuario.
+        raise _not_found()
+    watermark = stored.transactions_synced_until if stored else None
+    # Termina la transacción de lectura: la conexión vuelve al pool antes de esperar a Belvo.
+    db.rollback()
+    return watermark
+
+
+def _save_page(db: Session, rows: List[Dict[str, Any]]) -> None:
+    _upsert(db, models.Transaction, rows)
+    db.commit()
+
+
+def _finish_sync(db: Session, account_row: Dict[str, Any], rollups: bool, since: Optional[date]) -> None:
+    _upsert(db, models.Account, [account_row])
+    if rollups:
+        refresh_rollups(db, account_row["id"], since=since)
+    db.commit()
+
+
+def _rollup_sum(tx_type: str, tx_status: str, value):
+    T = models.Transaction
+    return func.coalesce(func.sum(case((and_(T.type == tx_type, T.status == tx_status), value), else_=0)), 0)
+
+
+def refresh_rollups(db: Session, account_id: str, since: Optional[date] = None) -> None:
+    """Recalcula los totales diarios de la cuenta desde `since` (o todos).
+
+    La sincronización sólo toca transacciones desde su ventana, así que basta
+    con rehacer esos días a partir de la tabla de transacciones. Se hace con
+    upsert para que dos sincronizaciones simultáneas de la misma cuenta no
+    choquen en la clave (account_id, day).
+    """
+    T, R = models.Transaction, models.TransactionRollup
+    # Sólo se borran los días que ya no tienen transacciones.
+    stale = delete(R).where(
+        R.account_id == account_id,
+        ~select(T.id).where(T.account_id == R.account_id, T.value_date == R.day).exists(),
+    )
+    daily = (
+        select(
+            T.account_id,
+            T.value_date,
+            _rollup_sum("INFLOW", "PROCESSED", T.amount),
+            _rollup_sum("INFLOW", "PENDING", T.amount),
+            _rollup_sum("OUTFLOW", "PROCESSED", func.abs(T.amount)),
+            _rollup_sum("OUTFLOW", "PENDING", func.abs(T.amount)),
+            func.count(),
+        )
+        .where(T.account_id == account_id, T.value_date.isnot(None))
+        .group_by(T.account_id, T.value_date)
+    )
+    if since is not None:
+        stale = stale.where(R.day >= since)
+        daily = daily.where(T.value_date >= since)
+    db.execute(stale)
+    columns = ["inflow_processed", "inflow_pending", "outflow_processed", "outflow_pending", "transactions"]
+    upsert = insert(R).from_select(["account_id", "day", *columns], daily)
+    db.execute(upsert.on_conflict_do_update(
+        index_elements=[R.account_id, R.day],
+        set_={c: upsert.excluded[c] for c in columns},
+    ))
+
+
+async def refresh_account(account_id: str, link_id: str, account: Optional[Dict[str, Any]] = None) -> None:
+    """Sincroniza la cuenta en su propia sesión y deja sus KPIs recalculados en caché."""
+    db = SessionLocal()
+    try:
+        await sync_account_transactions(account_id, link_id, db, account=account)
+    finally:
+        # Cerrar hace rollback de la transacción abierta: también va a un hilo.
+        await asyncio.to_thread(db.close)
+
+    async def compute():
+        return await asyncio.to_thread(_stored_kpis, account_id)
+
+    await kpi_cache.invalidate_account(account_id, link_id)
+    await kpi_cache.get_or_compute(account_id, link_id, compute)
+
+
+def _stored_kpis(account_id: str) -> Dict[str, Any]:
+    with SessionLocal() as db:
+        return account_kpis(db.get(models.Account, account_id), db)
+
+
+async def synced_kpis(account_id: str, link_id: str) -> Dict[str, Any]:
+    """KPIs de la cuenta sincronizada, en una sesión propia.
+
+    Se usa como cálculo de `kpi_cache`: puede seguir corriendo cuando la
+    petición que lo inició ya terminó, así que no toma la sesión de ésta.
+    """
+    db = SessionLocal()
+    try:
+        account = await ensure_synced(account_id, link_id, db)
+        return await asyncio.to_thread(account_kpis, account, db)
+    finally:
+        await asyncio.to_thread(db.close)
+
+
+def _is_fresh(account: Optional[models.Account]) -> bool:
+    if account is None or account.last_synced_at is None:
+        return False
+    age = datetime.now(timezone.utc) - account.last_synced_at
+    return age < timedelta(seconds=settings.TRANSACTION_SYNC_INTERVAL_SECONDS)
+
+
+async def ensure_synced(account_id: str, link_id: str, db: Session) -> models.Account:
+    """Devuelve la cuenta local, sincronizándola antes si está vencida.
+
+    Responde 404 si la cuenta pertenece a otro link. Si Belvo falla y ya hay
+    datos locales, se sirven los datos anteriores.
+    """
+    account = await asyncio.to_thread(db.get, models.Account, account_id)
+    if account is not None and account.link_id != link_id:
+        raise _not_found()
+    if _is_fresh(account):
+        return account
+    try:
+        await sync_account_transactions(account_id, link_id, db)
+    except (HTTPException, SQLAlchemyError):
+        await asyncio.to_thread(db.rollback)
+        if account is None:
+            raise
+        logger.warning("Sincronización de %s fallida, se sirven datos locales", account_id, exc_info=True)
+    return await asyncio.to_thread(_reload_account, db, account_id)
+
+
+def _reload_account(db: Session, account_id: str) -> Optional[models.Account]:
+    db.expire_all()
+    return db.get(models.Account, account_id)
+
+
+def account_kpis(account: models.Account, db: Session) -> Dict[str, Any]:
+    """KPIs a partir de agregados SQL sobre las transacciones locales."""
+    rows = (
+        db.query(
+            models.Transaction.type,
+            models.Transaction.status,
+            func.sum(models.Transaction.amount),
+            func.sum(func.abs(models.Transaction.amount)),
+        )
+        .filter(models.Transaction.account_id == account.id)
+        .group_by(models.Transaction.type, models.Transaction.status)
+        .all()
+    )
+    if not rows:
+        return kpis.empty_kpis(account.raw)
+
+    buckets = [0] * kpis.N_BUCKETS
+    for tx_type, tx_status, total, total_abs in rows:
+        i = kpis.BUCKET_INDEX.get((tx_type, tx_status))
+        if i is None:
+            continue
+        buckets[i] = total_abs if i >= kpis.OUTFLOW_PROCESSED else total
+    return kpis.kpis_from_buckets(buckets, account.raw)
+
+
+def kpi_series(
+    account: models.Account,
+    db: Session,
+    interval: str = "day",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> Dict[str, Any]:
+    """Ingresos, egresos y flujo neto por día, semana o mes desde los totales diarios."""
+    R = models.TransactionRollup
+    query = db.query(
+        R.day, R.inflow_processed, R.inflow_pending, R.outflow_processed, R.outflow_pending, R.transactions
+    ).filter(R.account_id == account.id)
+    if date_from:
+        query = query.filter(R.day >= date_from)
+    if date_to:
+        query = query.filter(R.day <= date_to)
+    rows = query.order_by(R.day).all()
+    _check_series_range(interval, date_from or (rows[0].day if rows else None), date_to or (rows[-1].day if rows else None))
+    return {
+        "account_id": account.id,
+        "currency": (account.raw or {}).get("currency"),
+        "interval": interval,
+        "series": kpis.series_from_daily(rows, interval, date_from, date_to),
+    }
+
+
+def _check_series_range(interval: str, first: Optional[date], last: Optional[date]) -> None:
+    """Rechaza rangos invertidos o con más de KPI_SERIES_MAX_PERIODS periodos."""
+    if first is None or last is None:
+        return
+    if first > last:
+        raise HTTPException(status_code=400, detail="date_from debe ser anterior a date_to")
+    periods = (last - first).days // kpis.PERIOD_DAYS[interval] + 1
+    if periods > settings.KPI_SERIES_MAX_PERIODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El rango pedido supera {settings.KPI_SERIES_MAX_PERIODS} periodos; acótalo con date_from y date_to",
+        )
+
+
+# Columnas por las que se puede ordenar, cada una con su índice (account_id, columna, id).
+# value_date nulo va antes que cualquier fecha (al final en orden descendente).
+SORT_COLUMNS = {
+    "value_date": models.Transaction.value_date,
+    "amount": models.Transaction.amount,
+}
+
+
+def encode_cursor(sort: str, value: Any, tx_id: str) -> str:
+    if isinstance(value, date):
+        value = value.isoformat()
+    raw = orjson.dumps([sort, value, tx_id])
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Sequence[Any]:
+    try:
+        cursor_sort, value, tx_id = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if cursor_sort != sort:
+            raise ValueError(cursor_sort)
+        if sort.lstrip("-") == "value_date" and value is not None:
+            value = date.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido para este orden")
+    return value, tx_id
+
+
+def list_transactions(
+    db: Session,
+    account_id: str,
+    *,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    types: Sequence[str] = (),
+    statuses: Sequence[str] = (),
+    categories: Sequence[str] = (),
+    sort: str = "-value_date",
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> Dict[str, Any]:
+    """Página de transacciones locales con paginación keyset sobre (orden, id).
+
+    El cursor codifica el último (valor de orden, id) entregado, así cada
+    página es un rango del índice (account_id, orden, id) sin OFFSET. Las
+    filas con value_date nulo se recorren como un tramo aparte, por id.
+    """
+    descending = sort.startswith("-")
+    column = SORT_COLUMNS.get(sort.lstrip("-"))
+    if column is None:
+        raise HTTPException(status_code=400, detail=f"Orden no soportado: {sort}")
+
+    T = models.Transaction
+    query = db.query(T.raw, column).filter(T.account_id == account_id)
+    if date_from:
+        query = query.filter(T.value_date >= date_from)
+    if date_to:
+        query = query.filter(T.value_date <= date_to)
+    if types:
+        query = query.filter(T.type.in_(types))
+    if statuses:
+        query = query.filter(T.status.in_(statuses))
+    if categories:
+        query = query.filter(T.category.in_(categories))
+
+    if descending:
+        order = (column.desc().nulls_last() if column.nullable else column.desc(), T.id.desc())
+    else:
+        order = (column.asc().nulls_first() if column.nullable else column.asc(), T.id)
+    rows: List[Any] = []
+    for segment in _keyset_segments(column, descending, decode_cursor(cursor, sort) if cursor else None):
+        rows.extend(query.filter(segment).order_by(*order).limit(limit + 1 - len(rows)).all())
+        if len(rows) > limit:
+            break
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last_raw, last_value = rows[-1]
+        next_cursor = encode_cursor(sort, last_value, last_raw["id"])
+    return {"results": [raw for raw, _ in rows], "next_cursor": next_cursor, "has_more": has_more}
+
+
+def _keyset_segments(column, descending: bool, position: Optional[Sequence[Any]]) -> List[Any]:
+    """Condiciones a recorrer en orden tras `position`: el tramo de nulos y el de valores.
+
+    Una comparación de tuplas con NULL no es verdadera ni falsa, así que cada
+    tramo lleva su propia condición y ambos son rangos contiguos del índice.
+    """
+    T = models.Transaction
+    if position is None:
+        nulls, values = column.is_(None), column.isnot(None)
+    else:
+        value, tx_id = position
+        if value is None:
+            nulls = and_(column.is_(None), T.id < tx_id if descending else T.id > tx_id)
+            # Los valores van antes que los nulos en orden descendente: ya se entregaron.
+            values = None if descending else column.isnot(None)
+        else:
+            after, at = tuple_(column, T.id), tuple_(value, tx_id)
+            values = after < at if descending else after > at
+            nulls = column.is_(None) if descending else None
+    segments = [values, nulls] if descending else [nulls, values]
+    if not column.nullable:
+        segments = [values]
+    return [segment for segment in segments if segment is not None]
+
+
+async def stream_account_kpis(
+    account: models.Account, db: Session, batch_size: int = 1000, selection: FieldSelection = FieldSelection()
+) -> AsyncIterator[bytes]:
+    """KPIs junto con las transacciones locales, serializadas por lotes.
+
+    Las transacciones se emiten con la cuenta embebida, igual que las devuelve Belvo.
+    Cada lote se lee del cursor en un hilo.
+    """
+    summary = selection.apply(await asyncio.to_thread(account_kpis, account, db))
+    account_json = orjson.dumps(account.raw)
+    query = (
+        select(models.Transaction.raw)
+        .where(models.Transaction.account_id == account.id)
+        .order_by(models.Transaction.value_date.asc().nulls_first(), models.Transaction.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    async def body() -> AsyncIterator[bytes]:
+        yield b'{"transactions":['
+        batches = (await asyncio.to_thread(db.execute, query)).partitions()
+        separator = b""
+        while True:
+            rows = await asyncio.to_thread(next, batches, None)
+            if rows is None:
+                break
+            yield separator + b",".join(
+                orjson.dumps(raw)[:-1] + b',"account":' + account_json + b"}" for (raw,) in rows
+            )
+            separator = b","
+        yield b"]" + (b"," + orjson.dumps(summary)[1:] if summary else b"}")
+
+    return body()
@@ -0,0 +1,163 @@
+import asyncio
+import hmac
+import logging
+from typing import Any, Dict, List, Optional
+
+from cachetools import TTLCache
+from fastapi import HTTPException, status
+
+from app import belvo_client, invalidation, metrics, models, transaction_store
+from app.config import settings
+from app.database import SessionLocal
+from app.kpi_cache import kpi_cache
+
+logger = logging.getLogger(__name__)
+
+# Códigos de LINKS con los que el link deja de poder refrescarse.
+INVALID_LINK_CODES = {"invalid_credentials", "token_required", "login_error", "invalid"}
+
+
+def verify_authorization(header: Optional[str]) -> None:
+    """Belvo envía en cada webhook el Authorization configurado al registrarlo."""
+    expected = settings.BELVO_WEBHOOK_AUTHORIZATION
+    if not expected or not header or not hmac.compare_digest(header.encode(), expected.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Webhook no autorizado")
+
+
+def _account_ids(data: Dict[str, Any]) -> List[str]:
+    """Cuentas afectadas si el evento las indica (lista, dict por cuenta o `account_id`)."""
+    accounts = data.get("accounts") or data.get("account_ids")
+    if isinstance(accounts, dict):
+        return list(accounts)
+    if isinstance(accounts, list):
+        return [a["id"] if isinstance(a, dict) else a for a in accounts]
+    if data.get("account_id"):
+        return [data["account_id"]]
+    return []
+
+
+def _stored_account_ids(link_id: str) -> List[str]:
+    with SessionLocal() as db:
+        return [
+            account_id
+            for (account_id,) in db.query(models.Account.id).filter(models.Account.link_id == link_id)
+        ]
+
+
+async def handle_transactions(link_id: str, data: Dict[str, Any]) -> None:
+    # Sólo se sincronizan las cuentas ya almacenadas: las demás se traen al pedirlas.
+    # Todo el link sólo si el evento no dice qué cuentas cambiaron.
+    stored = set(await asyncio.to_thread(_stored_account_ids, link_id))
+    named = _account_ids(data)
+    account_ids = [a for a in named if a in stored] if named else sorted(stored)
+    for account_id in account_ids:
+        await transaction_store.refresh_account(account_id, link_id)
+
+
+async def handle_accounts(link_id: str, data: Dict[str, Any]) -> None:
+    for account in await belvo_client.list_link_accounts(link_id):
+        await transaction_store.refresh_account(account["id"], link_id, account)
+
+
+async def handle_link(link_id: str, code: str) -> None:
+    if code not in INVALID_LINK_CODES:
+        return
+    if await asyncio.to_thread(_invalidate_link, link_id):
+        await kpi_cache.invalidate_link(link_id)
+
+
+def _invalidate_link(link_id: str) -> bool:
+    with SessionLocal() as db:
+        link = db.get(models.Link, link_id)
+        if link is None:
+            return False
+        link.status = "invalid"
+        invalidation.notify(db.connection(), "link", user_id=link.user_id, institution=link.institution)
+        db.commit()
+        belvo_client.invalidate_link_cache(link.user_id, link.institution)
+    return True
+
+
+class WebhookProcessor:
+    """Cola acotada de eventos de Belvo atendida por `workers` tareas.
+
+    Los eventos repetidos (mismo webhook_id) se descartan. Si la cola está
+    llena el receptor responde 503 para que Belvo reintente más tarde.
+    """
+
+    def __init__(self, maxsize: int, workers: int, dedup_ttl: float):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.workers = workers
+        self._seen: TTLCache = TTLCache(maxsize=10000, ttl=dedup_ttl)
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 0) -> None:
+        """Detiene los workers, esperando antes hasta `drain_timeout` a que se vacíe la cola."""
+        if self._tasks and drain_timeout > 0:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Se descartan %d webhooks pendientes al apagar", self.queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, event: Dict[str, Any]) -> bool:
+        """Encola el evento; devuelve False si era un duplicado."""
+        webhook_id = event.get("webhook_id")
+        if webhook_id and webhook_id in self._seen:
+            metrics.WEBHOOK_EVENTS.labels(type=event.get("webhook_type", ""), result="duplicate").inc()
+            return False
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            metrics.WEBHOOK_EVENTS.labels(type=event.get("webhook_type", ""), result="rejected").inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Cola de webhooks llena, reintenta más tarde",
+                headers={"Retry-After": "30"},
+            )
+        if webhook_id:
+            self._seen[webhook_id] = True
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            event = await self.queue.get()
+            try:
+                await self.process(event)
+                result = "ok"
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                result = "error"
+                logger.exception("Error procesando el webhook %s", event.get("webhook_id"))
+            finally:
+                self.queue.task_done()
+            metrics.WEBHOOK_EVENTS.labels(type=event.get("webhook_type", ""), result=result).inc()
+
+    async def process(self, event: Dict[str, Any]) -> None:
+        webhook_type = (event.get("webhook_type") or "").upper()
+        code = (event.get("webhook_code") or "").lower()
+        link_id = event.get("link_id")
+        data = event.get("data") or {}
+        if not link_id:
+            return
+        if webhook_type == "TRANSACTIONS":
+            await handle_transactions(link_id, data)
+        elif webhook_type == "ACCOUNTS":
+            await handle_accounts(link_id, data)
+        elif webhook_type == "LINKS":
+            await handle_link(link_id, code)
+
+
+processor = WebhookProcessor(
+    maxsize=settings.WEBHOOK_QUEUE_SIZE,
+    workers=settings.WEBHOOK_WORKERS,
+    dedup_ttl=settings.WEBHOOK_DEDUP_TTL_SECONDS,
+)
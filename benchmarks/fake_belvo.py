@@ -0,0 +1,212 @@
+"""Servidor Belvo falso y determinista para pruebas locales y benchmarks.
+
+Sirve /api/institutions/, /api/links/, /api/accounts/ y /api/transactions/
+(paginado con cursores `next`) con datos generados a partir de una semilla.
+Latencia, tasa de errores y volumen se configuran por variables de entorno:
+
+    FAKE_BELVO_LATENCY_MS=80 FAKE_BELVO_ERROR_RATE=0.01 \\
+    FAKE_BELVO_TRANSACTIONS_PER_ACCOUNT=5000 \\
+    uvicorn benchmarks.fake_belvo:app --port 8001
+
+y la API se apunta a él con BELVO_BASE_URL=http://127.0.0.1:8001/api.
+"""
+import asyncio
+import os
+import random
+import uuid
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+
+def _env(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+LATENCY_MS = _env("FAKE_BELVO_LATENCY_MS", 50)
+JITTER_MS = _env("FAKE_BELVO_JITTER_MS", 20)
+ERROR_RATE = _env("FAKE_BELVO_ERROR_RATE", 0.0)
+RATE_LIMIT_RATE = _env("FAKE_BELVO_RATE_LIMIT_RATE", 0.0)
+INSTITUTIONS = int(_env("FAKE_BELVO_INSTITUTIONS", 25))
+ACCOUNTS_PER_LINK = int(_env("FAKE_BELVO_ACCOUNTS_PER_LINK", 4))
+TRANSACTIONS_PER_ACCOUNT = int(_env("FAKE_BELVO_TRANSACTIONS_PER_ACCOUNT", 2000))
+SEED = int(_env("FAKE_BELVO_SEED", 42))
+
+CATEGORIES = ["CHECKING_ACCOUNT", "SAVINGS_ACCOUNT", "CREDIT_CARD", "LOAN_ACCOUNT", "PENSION_FUND_ACCOUNT"]
+NAMESPACE = uuid.UUID("6f1c9a52-3c1e-4a53-9d0c-2f4a1b7e8d90")
+
+app = FastAPI(title="Fake Belvo")
+_faults = random.Random(SEED)
+
+
+def _id(*parts: Any) -> str:
+    return str(uuid.uuid5(NAMESPACE, ":".join(str(p) for p in parts)))
+
+
+def _institution(n: int) -> Dict[str, Any]:
+    name = f"fakebank_{n:03d}_mx_retail"
+    return {
+        "id": n + 1,
+        "name": name,
+        "display_name": f"Fake Bank {n}",
+        "type": "bank",
+        "code": name,
+        "country_code": "MX",
+        "country_codes": ["MX"],
+        "website": None,
+        "primary_color": "#056dae",
+        "logo": None,
+        "icon_logo": None,
+        "text_logo": None,
+        "form_fields": [
+            {"name": "username", "type": "text", "validation": "^[a-z]{6,8}$"},
+            {"name": "password", "type": "password", "validation": "^[a-zA-Z0-9]{8}$"},
+        ],
+        "features": [],
+        "integration_type": "credentials",
+        "status": "healthy",
+        "resources": ["ACCOUNTS", "TRANSACTIONS", "BALANCES"],
+        "openbanking_information": None,
+    }
+
+
+@lru_cache(maxsize=None)
+def _accounts(link_id: str) -> List[Dict[str, Any]]:
+    rnd = random.Random(f"{SEED}:{link_id}")
+    accounts = []
+    for n in range(ACCOUNTS_PER_LINK):
+        category = CATEGORIES[n % len(CATEGORIES)]
+        account = {
+            "id": _id("account", link_id, n),
+            "link": link_id,
+            "institution": {"name": _link_institutions.get(link_id), "type": "bank"},
+            "name": f"Cuenta {n}",
+            "type": "Cuenta",
+            "category": category,
+            "currency": "MXN",
+            "balance": {"current": round(rnd.uniform(-5000, 50000), 2), "available": None},
+        }
+        if category == "PENSION_FUND_ACCOUNT":
+            account["funds_data"] = [{"balance": round(rnd.uniform(1000, 90000), 2)}]
+        accounts.append(account)
+    return accounts
+
+
+def _account(account_id: str) -> Optional[Dict[str, Any]]:
+    for link_id in _links.values():
+        for account in _accounts(link_id):
+            if account["id"] == account_id:
+                return account
+    return None
+
+
+@lru_cache(maxsize=256)
+def _transactions(account_id: str) -> List[Dict[str, Any]]:
+    account = _account(account_id)
+    rnd = random.Random(f"{SEED}:{account_id}")
+    start = date(2023, 1, 1)
+    txs = []
+    for n in range(TRANSACTIONS_PER_ACCOUNT):
+        value_date = start + timedelta(days=n * 730 // max(1, TRANSACTIONS_PER_ACCOUNT))
+        txs.append({
+            "id": _id("tx", account_id, n),
+            "account": account,
+            "value_date": value_date.isoformat(),
+            "accounting_date": f"{value_date.isoformat()}T12:00:00Z",
+            "amount": round(rnd.uniform(1, 3000), 2),
+            "currency": "MXN",
+            "type": rnd.choice(("INFLOW", "OUTFLOW")),
+            "status": "PENDING" if rnd.random() < 0.1 else "PROCESSED",
+            "category": rnd.choice(("Food & Groceries", "Income & Payments", "Transfers", "Bills & Utilities")),
+            "description": f"Movimiento {n}",
+        })
+    return txs
+
+
+# institución -> link_id; los links son idempotentes por institución.
+_links: Dict[str, str] = {}
+_link_institutions: Dict[str, str] = {}
+
+
+def _page(request: Request, items: List[Any], default_size: int = 100) -> Dict[str, Any]:
+    page = int(request.query_params.get("page", 1))
+    size = int(request.query_params.get("page_size", default_size))
+    start = (page - 1) * size
+    results = items[start:start + size]
+    next_url = None
+    if start + size < len(items):
+        next_url = str(request.url.include_query_params(page=page + 1, page_size=size))
+    previous_url = str(request.url.include_query_params(page=page - 1, page_size=size)) if page > 1 else None
+    return {"count": len(items), "next": next_url, "previous": previous_url, "results": results}
+
+
+@app.middleware("http")
+async def latency_and_faults(request: Request, call_next):
+    delay = max(0.0, LATENCY_MS + _faults.uniform(-JITTER_MS, JITTER_MS)) / 1000
+    await asyncio.sleep(delay)
+    roll = _faults.random()
+    if roll < RATE_LIMIT_RATE:
+        return JSONResponse({"detail": "Too many requests"}, status_code=429, headers={"Retry-After": "1"})
+    if roll < RATE_LIMIT_RATE + ERROR_RATE:
+        return JSONResponse({"detail": "Service unavailable"}, status_code=503)
+    return await call_next(request)
+
+
+@app.get("/api/institutions/")
+async def institutions(request: Request):
+    return _page(request, [_institution(n) for n in range(INSTITUTIONS)])
+
+
+@app.get("/api/institutions/{institution_id}/")
+async def institution(institution_id: int):
+    if not 1 <= institution_id <= INSTITUTIONS:
+        raise HTTPException(status_code=404, detail="Not found")
+    return _institution(institution_id - 1)
+
+
+@app.post("/api/links/", status_code=201)
+async def create_link(payload: Dict[str, Any]):
+    name = payload.get("institution")
+    if not name:
+        raise HTTPException(status_code=400, detail=[{"code": "required", "field": "institution"}])
+    link_id = _links.setdefault(name, _id("link", name))
+    _link_institutions[link_id] = name
+    return {
+        "id": link_id,
+        "institution": name,
+        "access_mode": "recurrent",
+        "status": "valid",
+        "refresh_rate": "24h",
+        "created_by": "fake",
+        "fetch_resources": payload.get("fetch_resources"),
+        "credentials_storage": "30d",
+        "stale_in": "365d",
+        "external_id": None,
+        "institution_user_id": _id("user", name),
+        "last_accessed_at": None,
+    }
+
+
+@app.get("/api/accounts/")
+async def accounts(request: Request, link: Optional[str] = None):
+    items = _accounts(link) if link in _links.values() else []
+    return _page(request, items)
+
+
+@app.get("/api/accounts/{account_id}/")
+async def account(account_id: str):
+    found = _account(account_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return found
+
+
+@app.get("/api/transactions/")
+async def transactions(request: Request, account: str, value_date__gte: Optional[str] = None):
+    items = _transactions(account) if _account(account) else []
+    if value_date__gte:
+        items = [t for t in items if t["value_date"] >= value_date__gte]
+    return _page(request, items)
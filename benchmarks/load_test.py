@@ -0,0 +1,153 @@
+"""Prueba de carga de los endpoints calientes de la API.
+
+Recorre /banks, /bank/{bank}/accounts y /account/{id}/kpis/{bank} con la
+concurrencia indicada y reporta RPS y latencias p50/p95/p99 por escenario.
+Con --save-baseline guarda los resultados en benchmarks/baselines/; con
+--compare falla (exit 1) si algún escenario empeora más que --tolerance
+respecto a la línea base guardada.
+
+    # Belvo falso + API apuntando a él
+    uvicorn benchmarks.fake_belvo:app --port 8001 &
+    BELVO_BASE_URL=http://127.0.0.1:8001/api uvicorn app.main:app --port 8080 &
+
+    python -m benchmarks.load_test --base-url http://127.0.0.1:8080 \\
+        --bank fakebank_000_mx_retail --concurrency 32 --requests 2000 --compare
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+SCENARIOS = ("banks", "accounts", "kpis")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def authenticate(client: httpx.AsyncClient, username: str, password: str) -> str:
+    credentials = {"username": username, "password": password}
+    r = await client.post("/login", json=credentials)
+    if r.status_code == 401:
+        await client.post("/register", json=credentials)
+        r = await client.post("/login", json=credentials)
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+async def run_scenario(client: httpx.AsyncClient, paths: List[str], requests: int, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for n in counter:
+            path = paths[n % len(paths)]
+            start = time.perf_counter()
+            try:
+                r = await client.get(path)
+                status = r.status_code
+            except httpx.HTTPError as exc:
+                status = exc.__class__.__name__
+            elapsed = time.perf_counter() - start
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p95_ms": percentile(latencies, 95) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+        "mean_ms": (statistics.fmean(latencies) if latencies else 0.0) * 1e3,
+    }
+
+
+def compare(name: str, result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    for metric in ("p50_ms", "p95_ms", "p99_ms"):
+        if baseline.get(metric) and result[metric] > baseline[metric] * (1 + tolerance):
+            regressions.append(f"{name}: {metric} {result[metric]:.1f} > {baseline[metric]:.1f} (+{tolerance:.0%})")
+    if baseline.get("rps") and result["rps"] < baseline["rps"] * (1 - tolerance):
+        regressions.append(f"{name}: rps {result['rps']:.1f} < {baseline['rps']:.1f} (-{tolerance:.0%})")
+    return regressions
+
+
+async def main_async(args) -> int:
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) as client:
+        token = await authenticate(client, args.username, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        # Calentamiento: llena el catálogo y registra el link del banco.
+        (await client.get("/banks")).raise_for_status()
+        accounts = (await client.get(f"/bank/{args.bank}/accounts")).raise_for_status().json()
+        account_ids = [a["id"] for a in accounts.get("results", [])]
+        if not account_ids and "kpis" in args.scenarios:
+            print(f"El banco {args.bank} no tiene cuentas; se omite el escenario kpis", file=sys.stderr)
+            args.scenarios = [s for s in args.scenarios if s != "kpis"]
+
+        paths = {
+            "banks": ["/banks"],
+            "accounts": [f"/bank/{args.bank}/accounts"],
+            "kpis": [f"/account/{account_id}/kpis/{args.bank}" for account_id in account_ids],
+        }
+
+        regressions: List[str] = []
+        print(f"{'scenario':<10} {'ok':>6} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name in args.scenarios:
+            result = await run_scenario(client, paths[name], args.requests, args.concurrency)
+            print(
+                f"{name:<10} {result['ok']:>6} {sum(result['errors'].values()):>5} {result['rps']:>8.1f} "
+                f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+            )
+            baseline_file = BASELINE_DIR / f"{name}.json"
+            if args.compare and baseline_file.exists():
+                regressions += compare(name, result, json.loads(baseline_file.read_text()), args.tolerance)
+            if args.save_baseline:
+                BASELINE_DIR.mkdir(exist_ok=True)
+                baseline_file.write_text(json.dumps(result, indent=2) + "\n")
+
+    for line in regressions:
+        print(f"REGRESIÓN {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8080")
+    parser.add_argument("--username", default="loadtest")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--bank", default="fakebank_000_mx_retail")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="peticiones por escenario")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="margen antes de considerar regresión (0.2 = 20%%)")
+    sys.exit(asyncio.run(main_async(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Esquema inicial (users, links, institutions)
+
+Es el esquema que creaba `create_all` al importar la app. Las bases creadas
+así ya tienen estas tablas: se conservan y sólo se crean las que falten, de
+modo que `alembic upgrade head` funciona tanto en una base vacía como en la
+de producción sin versionar.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _existing_tables() -> set:
+    if context.is_offline_mode():
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    existing = _existing_tables()
+    if "users" not in existing:
+        _create_users()
+    if "links" not in existing:
+        _create_links()
+    if "institutions" not in existing:
+        _create_institutions()
+
+
+def _create_users() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(length=64), nullable=False),
+        sa.Column("hashed_password", sa.String(length=128), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+
+def _create_links() -> None:
+    op.create_table(
+        "links",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("institution", sa.String(), nullable=False),
+        sa.Column("access_mode", sa.String()),
+        sa.Column("last_accessed_at", sa.String()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("external_id", sa.String()),
+        sa.Column("institution_user_id", sa.String()),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("created_by", sa.String()),
+        sa.Column("refresh_rate", sa.String()),
+        sa.Column("credentials_storage", sa.String()),
+        sa.Column("fetch_resources", sa.JSON()),
+        sa.Column("stale_in", sa.String()),
+        sa.Column("credentials", sa.JSON()),
+    )
+    op.create_index("ix_links_id", "links", ["id"])
+
+
+def _create_institutions() -> None:
+    op.create_table(
+        "institutions",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("code", sa.String(), nullable=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("display_name", sa.String(), nullable=True),
+        sa.Column("type", sa.String(), nullable=True),
+        sa.Column("country_code", sa.String(), nullable=True),
+        sa.Column("country_codes", postgresql.JSONB(), nullable=True),
+        sa.Column("website", sa.String(), nullable=True),
+        sa.Column("primary_color", sa.String(), nullable=True),
+        sa.Column("logo", sa.String(), nullable=True),
+        sa.Column("icon_logo", sa.String(), nullable=True),
+        sa.Column("text_logo", sa.String(), nullable=True),
+        sa.Column("form_fields", postgresql.JSONB(), nullable=True),
+        sa.Column("features", postgresql.JSONB(), nullable=True),
+        sa.Column("integration_type", sa.String(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("resources", postgresql.JSONB(), nullable=True),
+        sa.Column("openbanking_information", postgresql.JSONB(), nullable=True),
+    )
+    op.create_index("ix_institutions_id", "institutions", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("institutions")
+    op.drop_table("links")
+    op.drop_table("users")
@@ -0,0 +1,72 @@
+"""Links por usuario, hash de instituciones y almacén de transacciones
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("links", sa.Column("user_id", sa.Integer(), nullable=True))
+    op.create_foreign_key("links_user_id_fkey", "links", "users", ["user_id"], ["id"], ondelete="CASCADE")
+    op.create_index("ix_links_user_id", "links", ["user_id"])
+    op.create_index("ix_links_institution", "links", ["institution"])
+    op.create_unique_constraint("uq_links_user_institution", "links", ["user_id", "institution"])
+
+    op.add_column("institutions", sa.Column("content_hash", sa.String(length=64), nullable=True))
+    op.create_index("ix_institutions_name", "institutions", ["name"])
+
+    op.create_table(
+        "accounts",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("link_id", sa.String(), nullable=False),
+        sa.Column("institution", sa.String(), nullable=True),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("type", sa.String(), nullable=True),
+        sa.Column("category", sa.String(), nullable=True),
+        sa.Column("currency", sa.String(), nullable=True),
+        sa.Column("balance_current", sa.Float(), nullable=True),
+        sa.Column("raw", postgresql.JSONB(), nullable=True),
+        sa.Column("transactions_synced_until", sa.Date(), nullable=True),
+        sa.Column("last_synced_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_accounts_id", "accounts", ["id"])
+    op.create_index("ix_accounts_link_id", "accounts", ["link_id"])
+
+    op.create_table(
+        "transactions",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("account_id", sa.String(), nullable=False),
+        sa.Column("link_id", sa.String(), nullable=False),
+        sa.Column("value_date", sa.Date(), nullable=True),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("currency", sa.String(), nullable=True),
+        sa.Column("type", sa.String(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("category", sa.String(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("raw", postgresql.JSONB(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_transactions_account_value_date", "transactions", ["account_id", "value_date"])
+    op.create_index("ix_transactions_account_type_status", "transactions", ["account_id", "type", "status"])
+
+
+def downgrade() -> None:
+    op.drop_table("transactions")
+    op.drop_table("accounts")
+    op.drop_index("ix_institutions_name", table_name="institutions")
+    op.drop_column("institutions", "content_hash")
+    op.drop_constraint("uq_links_user_institution", "links", type_="unique")
+    op.drop_index("ix_links_institution", table_name="links")
+    op.drop_index("ix_links_user_id", table_name="links")
+    op.drop_constraint("links_user_id_fkey", "links", type_="foreignkey")
+    op.drop_column("links", "user_id")
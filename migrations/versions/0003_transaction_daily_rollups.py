@@ -0,0 +1,46 @@
+"""Totales diarios por cuenta para las series de KPIs
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "transaction_daily_rollups",
+        sa.Column("account_id", sa.String(), primary_key=True),
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("inflow_processed", sa.Float(), nullable=False),
+        sa.Column("inflow_pending", sa.Float(), nullable=False),
+        sa.Column("outflow_processed", sa.Float(), nullable=False),
+        sa.Column("outflow_pending", sa.Float(), nullable=False),
+        sa.Column("transactions", sa.Integer(), nullable=False),
+    )
+    # Las cuentas ya sincronizadas se rellenan desde sus transacciones.
+    op.execute(
+        """
+        INSERT INTO transaction_daily_rollups
+            (account_id, day, inflow_processed, inflow_pending, outflow_processed, outflow_pending, transactions)
+        SELECT account_id, value_date,
+            COALESCE(SUM(amount) FILTER (WHERE type = 'INFLOW' AND status = 'PROCESSED'), 0),
+            COALESCE(SUM(amount) FILTER (WHERE type = 'INFLOW' AND status = 'PENDING'), 0),
+            COALESCE(SUM(ABS(amount)) FILTER (WHERE type = 'OUTFLOW' AND status = 'PROCESSED'), 0),
+            COALESCE(SUM(ABS(amount)) FILTER (WHERE type = 'OUTFLOW' AND status = 'PENDING'), 0),
+            COUNT(*)
+        FROM transactions
+        WHERE value_date IS NOT NULL
+        GROUP BY account_id, value_date
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("transaction_daily_rollups")
@@ -0,0 +1,39 @@
+"""Índices de la paginación keyset de transacciones
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY no bloquea las escrituras de las sincronizaciones, pero no
+    # puede correr dentro de una transacción.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_transactions_account_value_date_id",
+            "transactions",
+            ["account_id", sa.text("value_date NULLS FIRST"), "id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_transactions_account_amount_id",
+            "transactions",
+            ["account_id", "amount", "id"],
+            postgresql_concurrently=True,
+        )
+        # El nuevo índice cubre también los filtros por (account_id, value_date).
+        op.drop_index("ix_transactions_account_value_date", table_name="transactions", postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    op.create_index("ix_transactions_account_value_date", "transactions", ["account_id", "value_date"])
+    op.drop_index("ix_transactions_account_amount_id", table_name="transactions")
+    op.drop_index("ix_transactions_account_value_date_id", table_name="transactions")
@@ -0,0 +1,23 @@
+"""Próximo refresco en segundo plano de cada link
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("links", sa.Column("next_refresh_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_index("ix_links_next_refresh_at", "links", ["next_refresh_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_links_next_refresh_at", table_name="links")
+    op.drop_column("links", "next_refresh_at")
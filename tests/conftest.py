@@ -0,0 +1,10 @@
+import os
+
+# Configuración mínima para importar la app sin .env ni Postgres.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("BELVO_CLIENT_ID", "test")
+os.environ.setdefault("BELVO_SECRET", "test")
+os.environ.setdefault("BELVO_BASE_URL", "http://belvo.test/api")
+os.environ.setdefault("AMMPER_USER", "test")
+os.environ.setdefault("AMMPER_PASSWORD", "test")
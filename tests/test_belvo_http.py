@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import belvo_http
+from app.resilience import CircuitBreaker, CircuitOpenError, TokenBucket
+from benchmarks import fake_belvo
+
+
+@pytest.fixture
+def belvo(monkeypatch):
+    """belvo_http contra el Belvo falso, con breaker y limitador propios del test."""
+    monkeypatch.setattr(fake_belvo, "LATENCY_MS", 0)
+    monkeypatch.setattr(fake_belvo, "JITTER_MS", 0)
+    monkeypatch.setattr(belvo_http, "breaker", CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+    monkeypatch.setattr(belvo_http, "rate_limiter", TokenBucket(rate=1000, capacity=1000))
+    client = httpx.AsyncClient(base_url=belvo_http.BASE, transport=httpx.ASGITransport(app=fake_belvo.app))
+    monkeypatch.setattr(belvo_http, "_client", client)
+    return belvo_http
+
+
+def _open(breaker: CircuitBreaker) -> None:
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+async def _cancel_probe(belvo, monkeypatch) -> None:
+    """Lanza la llamada de prueba del circuito semiabierto y la cancela a mitad de la respuesta."""
+    monkeypatch.setattr(fake_belvo, "LATENCY_MS", 500)
+    probe = asyncio.ensure_future(belvo.request("GET", "/institutions/"))
+    await asyncio.sleep(0.05)
+    assert belvo.breaker.state == CircuitBreaker.HALF_OPEN
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    monkeypatch.setattr(fake_belvo, "LATENCY_MS", 0)
+
+
+def test_cancelled_probe_does_not_wedge_the_breaker(belvo, monkeypatch):
+    async def scenario():
+        _open(belvo.breaker)
+        await asyncio.sleep(0.06)
+        await _cancel_probe(belvo, monkeypatch)
+
+        r = await belvo.request("GET", "/institutions/")
+        assert r.status_code == 200
+        assert belvo.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_probe_cancelled_waiting_for_rate_limiter_is_released(belvo, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(belvo, "rate_limiter", TokenBucket(rate=1, capacity=1))
+        await belvo.rate_limiter.acquire()  # deja el limitador sin fichas ~1 s
+        _open(belvo.breaker)
+        await asyncio.sleep(0.06)
+
+        probe = asyncio.ensure_future(belvo.request("GET", "/institutions/"))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        monkeypatch.setattr(belvo, "rate_limiter", TokenBucket(rate=1000, capacity=1000))
+        r = await belvo.request("GET", "/institutions/")
+        assert r.status_code == 200
+        assert belvo.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_only_one_probe_while_half_open(belvo, monkeypatch):
+    async def scenario():
+        _open(belvo.breaker)
+        await asyncio.sleep(0.06)
+        monkeypatch.setattr(fake_belvo, "LATENCY_MS", 100)
+        probe = asyncio.ensure_future(belvo.request("GET", "/institutions/"))
+        await asyncio.sleep(0.02)
+        with pytest.raises(CircuitOpenError):
+            await belvo.request("GET", "/institutions/")
+        assert (await probe).status_code == 200
+        assert belvo.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())